@@ -1,15 +1,477 @@
 # Import required libraries
-from matplotlib.pyplot import plot, scatter
 import pandas as pd
 import numpy as np
 import os
-from dash import Dash, dash_table, html, dcc, Input, Output, State, no_update
-import plotly.graph_objects as go
-import plotly.express as px
-import plotly.subplots as sp
-from pathlib import Path
+import bisect
+import copy
+import functools
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict, namedtuple
+from dash import Dash, dash_table, html, dcc, Input, Output, State, no_update, ctx, Patch, ClientsideFunction
+import plotly.io as pio
+from plotly.io.json import to_json_plotly
+from dash.dash_table.Format import Format, Sign, Symbol
+from dash.exceptions import MissingCallbackContextException
+import nhl_store
+import nhl_metrics
 
-data =  pd.read_csv('combinedstats.csv')
+#Identifies a dataset in persisted caches
+def dataset_version(signature):
+    return hashlib.md5(json.dumps(signature, sort_keys=True).encode()).hexdigest()[:12]
+
+csv_path = 'combinedstats.csv'
+store_path = nhl_store.default_store_path(csv_path)
+#The dataset is loaded at import, or on first use with NHL_LAZY_START=1 so a process starts serving without reading
+#the store or building the name index. Callbacks read it through get_dataset()
+lazy_start = os.environ.get('NHL_LAZY_START') == '1'
+#One load of the dataset
+#data: typed, memory-mapped columns from the binary store. Rebuilt from the CSV whenever the CSV changes
+#player_index: the PlayerNameIndex of data
+#row_hashes: hashes of the CSV lines behind each row for incremental reloads
+#signature, version: the CSV the data was read from, and its id in persisted caches
+#stats_db: season tables, stat summaries and graph view data can be queried from an embedded DuckDB database instead,
+#so only result sets are materialized. Set NHL_BACKEND=duckdb to enable (pip install duckdb). The player browser and
+#name index still read the store
+#generation: counts the datasets swapped in. A reload builds a new Dataset and swaps it in with one assignment, so a
+#callback that reads the dataset once sees the frame and index of the same load
+Dataset = namedtuple('Dataset', ['data', 'player_index', 'row_hashes', 'signature', 'version', 'stats_db', 'generation'])
+dataset = None
+sql_backend = os.environ.get('NHL_BACKEND') == 'duckdb'
+if sql_backend:
+    import nhl_sql
+
+#Normalize a player name for lookups. Strips accents, case and punctuation so 'St. Louis' == 'st louis'
+def normalize_name(name):
+    name = unicodedata.normalize('NFKD', str(name))
+    name = ''.join(c for c in name if not unicodedata.combining(c)).lower().replace("'", '')
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', name).split())
+
+#Player name index built once at load. Maps normalized full names to player_ids and player_ids to row positions,
+#with a sorted key list for prefix matches and a trigram index for typo tolerant matches
+class PlayerNameIndex:
+    def __init__(self, df, min_score=0.3):
+        self.min_score = min_score
+        #Row positions of every season for each player, in file order
+        self.rows = {pid: np.asarray(pos) for pid, pos in df.groupby('player_id', sort=False).indices.items()}
+        self.ids = np.array(list(self.rows), dtype=np.int64)
+        self.slots = {player_id: slot for slot, player_id in enumerate(self.rows)}
+        first_rows = [pos[0] for pos in self.rows.values()]
+        self.labels = (df['firstName'].iloc[first_rows].astype(str) + ' ' + df['lastName'].iloc[first_rows].astype(str)).tolist()
+        self.keys = [normalize_name(label) for label in self.labels]
+        self.last_keys = [normalize_name(name) for name in df['lastName'].iloc[first_rows]]
+        self.birth_years = df['birthDate'].iloc[first_rows].str[:4].tolist()
+        #Exact full name lookup. Different players can share a name (Sebastian Aho)
+        self.by_name = defaultdict(list)
+        for slot, key in enumerate(self.keys):
+            self.by_name[key].append(slot)
+        #Prefix lookup on the full name and on the last name
+        prefixes = []
+        for slot, key in enumerate(self.keys):
+            prefixes.append((key, slot))
+            prefixes.append((self.last_keys[slot], slot))
+        prefixes.sort()
+        self.prefix_keys = [key for key, _ in prefixes]
+        self.prefix_slots = [slot for _, slot in prefixes]
+        #Trigram postings for fuzzy matching
+        postings = defaultdict(list)
+        for slot, key in enumerate(self.keys):
+            for gram in self._trigrams(key):
+                postings[gram].append(slot)
+        self.trigrams = {gram: np.array(slots, dtype=np.int32) for gram, slots in postings.items()}
+        self.trigram_counts = np.array([len(self._trigrams(key)) for key in self.keys], dtype=np.int32)
+
+    @staticmethod
+    def _trigrams(key):
+        padded = '  ' + key + ' '
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def _prefix(self, key, limit):
+        start = bisect.bisect_left(self.prefix_keys, key)
+        slots = []
+        for i in range(start, len(self.prefix_keys)):
+            if not self.prefix_keys[i].startswith(key) or len(slots) >= limit:
+                break
+            if self.prefix_slots[i] not in slots:
+                slots.append(self.prefix_slots[i])
+        return slots
+
+    def _fuzzy(self, key, limit):
+        query_grams = self._trigrams(key)
+        grams = [self.trigrams[gram] for gram in query_grams if gram in self.trigrams]
+        if not grams:
+            return []
+        #Dice coefficient between the query trigrams and the trigrams of each candidate. Only players in the postings of
+        #the query's trigrams are scored, not every player
+        candidates, hits = np.unique(np.concatenate(grams), return_counts=True)
+        scores = 2 * hits / (self.trigram_counts[candidates] + len(query_grams))
+        close = scores >= self.min_score
+        candidates, scores = candidates[close], scores[close]
+        #Only the best few are sorted. Candidates tied with the last of them are kept so ties still go to the lowest slot
+        if len(scores) > limit:
+            cutoff = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+            best = scores >= cutoff
+            candidates, scores = candidates[best], scores[best]
+        best = np.lexsort((candidates, -scores))[:limit]
+        return [int(slot) for slot in candidates[best]]
+
+    #Splits a trailing birth year off a normalized query, e.g. 'sebastian aho 1996' -> ('sebastian aho', '1996'), so
+    #players sharing a name can be picked by the labels suggest() gives them
+    def _split_year(self, key):
+        name, _, year = key.rpartition(' ')
+        if len(year) == 4 and year.isdigit() and name in self.by_name:
+            return name, year
+        return key, None
+
+    #Returns the slots of every player the query names exactly, narrowed to a birth year if it has one
+    def _exact(self, query):
+        key, year = self._split_year(normalize_name(query))
+        return [slot for slot in self.by_name.get(key, []) if year is None or self.birth_years[slot] == year]
+
+    #Returns matching player slots ordered best first. Exact matches, then prefix matches, then fuzzy matches
+    def _search(self, query, limit):
+        key, _ = self._split_year(normalize_name(query))
+        if not key:
+            return []
+        slots = self._exact(query)
+        for matcher in (self._prefix, self._fuzzy):
+            if len(slots) >= limit:
+                break
+            slots += [slot for slot in matcher(key, limit) if slot not in slots]
+        return slots[:limit]
+
+    #Returns the player_id that best matches the query, or None if nothing is close
+    def lookup(self, query):
+        slots = self._search(query, 1)
+        return int(self.ids[slots[0]]) if slots else None
+
+    #Returns True if the query names a player exactly
+    def is_exact(self, query):
+        return bool(self._exact(query))
+
+    #Returns options for every player the query names exactly. More than one when players share the name
+    def namesakes(self, query):
+        return [self._option(slot) for slot in self._exact(query)]
+
+    #Returns [{'label', 'value'}] options for an autocomplete dropdown. Shared names are labelled with birth year
+    def suggest(self, query, limit=10):
+        return [self._option(slot) for slot in self._search(query, limit)]
+
+    #Returns dropdown options for known player_ids, in the order given
+    def options(self, player_ids):
+        return [self._option(self.slots[player_id]) for player_id in player_ids if player_id in self.slots]
+
+    def _option(self, slot):
+        label = self.labels[slot]
+        if len(self.by_name[self.keys[slot]]) > 1:
+            label += ' (' + self.birth_years[slot] + ')'
+        return {'label': label, 'value': int(self.ids[slot])}
+
+    #Returns the positions in the dataframe of every season played by a player
+    def player_rows(self, player_id):
+        return self.rows[player_id]
+
+    #Returns the positions of every season played by each of several players in one array, and the player_id of each
+    #position. Only the selected players' rows are touched
+    def players_rows(self, player_ids):
+        player_ids = [player_id for player_id in player_ids if player_id in self.rows]
+        rows = [self.rows[player_id] for player_id in player_ids]
+        owners = np.repeat(np.array(player_ids, dtype=np.int64), [len(positions) for positions in rows])
+        return (np.concatenate(rows) if rows else np.array([], dtype=np.int64)), owners
+
+    #Returns a copy of the index updated for rows of some players that were changed or appended, keeping the row
+    #positions of every other player. Running lookups may be reading this index, so it is never changed in place
+    def updated(self, df, player_ids):
+        index = copy.copy(self)
+        index.rows = dict(self.rows)
+        index.slots = dict(self.slots)
+        index.labels, index.keys = list(self.labels), list(self.keys)
+        index.last_keys, index.birth_years = list(self.last_keys), list(self.birth_years)
+        index.by_name = defaultdict(list, {key: list(slots) for key, slots in self.by_name.items()})
+        index.prefix_keys, index.prefix_slots = list(self.prefix_keys), list(self.prefix_slots)
+        index.trigrams = dict(self.trigrams)
+        index.trigram_counts = self.trigram_counts.copy()
+        index._update(df, player_ids)
+        return index
+
+    #Updates a copied index. New players are added to the name lookups and renamed players are re-indexed
+    def _update(self, df, player_ids):
+        player_col = df['player_id'].to_numpy()
+        positions = np.flatnonzero(np.isin(player_col, list(player_ids)))
+        groups = pd.Series(positions).groupby(player_col[positions], sort=False).indices
+        renamed = []
+        for player_id, group in groups.items():
+            player_id = int(player_id)
+            first = positions[group[0]]
+            label = str(df['firstName'].iloc[first]) + ' ' + str(df['lastName'].iloc[first])
+            slot = self.slots.get(player_id)
+            if slot is None:
+                slot = self.slots[player_id] = len(self.labels)
+                self.ids = np.append(self.ids, player_id)
+                self.trigram_counts = np.append(self.trigram_counts, 0)
+                self.labels.append(label)
+                self.keys.append('')
+                self.last_keys.append('')
+                self.birth_years.append('')
+                renamed.append((slot, first))
+            elif self.labels[slot] != label:
+                self._remove_names(slot)
+                self.labels[slot] = label
+                renamed.append((slot, first))
+            self.rows[player_id] = positions[group]
+        for slot, first in renamed:
+            self.keys[slot] = normalize_name(self.labels[slot])
+            self.last_keys[slot] = normalize_name(df['lastName'].iloc[first])
+            self.birth_years[slot] = str(df['birthDate'].iloc[first])[:4]
+            self._add_names(slot)
+
+    def _add_names(self, slot):
+        self.by_name[self.keys[slot]].append(slot)
+        for key in (self.keys[slot], self.last_keys[slot]):
+            i = bisect.bisect_right(self.prefix_keys, key)
+            self.prefix_keys.insert(i, key)
+            self.prefix_slots.insert(i, slot)
+        grams = self._trigrams(self.keys[slot])
+        for gram in grams:
+            self.trigrams[gram] = np.append(self.trigrams.get(gram, np.array([], dtype=np.int32)), np.int32(slot))
+        self.trigram_counts[slot] = len(grams)
+
+    def _remove_names(self, slot):
+        self.by_name[self.keys[slot]].remove(slot)
+        if not self.by_name[self.keys[slot]]:
+            del self.by_name[self.keys[slot]]
+        for key in (self.keys[slot], self.last_keys[slot]):
+            i = bisect.bisect_left(self.prefix_keys, key)
+            while self.prefix_slots[i] != slot:
+                i += 1
+            del self.prefix_keys[i]
+            del self.prefix_slots[i]
+        for gram in self._trigrams(self.keys[slot]):
+            self.trigrams[gram] = self.trigrams[gram][self.trigrams[gram] != slot]
+
+#Display labels for every source column. Shared by the player, league and summary views
+column_labels = {'name': 'Name',
+                 'birthDate': 'DoB',
+                 'primaryPosition': 'Position',
+                 'shootsCatches': 'Shoots',
+                 'season': 'Season',
+                 'salary': 'Cap Hit',
+                 'gamesPlayed': 'GP',
+                 'goals': 'G',
+                 'assists': 'A',
+                 'points': 'P',
+                 'pointsPerGame': 'PPG',
+                 'plusMinus': '+/-',
+                 'penaltyMinutes': 'PIM',
+                 'shots': 'S',
+                 'shootingPercentage': 'S%',
+                 'faceOffLosses': 'FOL',
+                 'faceOffWins': 'FOW',
+                 'faceOffTaken': 'FOT',
+                 'faceOffPercentage': 'FO%',
+                 'avgTimeOnIce': 'AToI',
+                 'timeOnIce': 'ToI',
+                 'avgPowerPlayTimeOnIce': 'AToI PP',
+                 'powerPlayTimeOnIce': 'ToI PP',
+                 'powerPlayGoals': 'PP G',
+                 'powerPlayAssists': 'PP A',
+                 'powerPlayPoints': 'PP P',
+                 'avgShortHandedTimeOnIce': 'AToI SH',
+                 'shortHandedTimeOnIce': 'ToI SH',
+                 'shortHandedGoals': 'SH G',
+                 'shortHandedAssists': 'SH A',
+                 'shortHandedPoints': 'SH P',
+                 'hits': 'HIT',
+                 'blocks': 'BLK',
+                 'takeaways': 'TK',
+                 'giveaways': 'GV',
+                 'turnoverDifferential': 'Turnover Diff'}
+label_columns = {label: column for column, label in column_labels.items()}
+
+#Formats only the distinct values of a column, then gathers the labels with a single take.
+#Avoids a Python call per row, the column usually has far fewer distinct values than rows
+def format_distinct(col, fmt):
+    uniques, codes = np.unique(col.to_numpy(), return_inverse=True)
+    labels = np.array([fmt(x) for x in uniques], dtype=object)
+    return pd.Series(labels[codes.ravel()], index=col.index)
+
+def format_signed(col):
+    return format_distinct(col, lambda x: '+' + str(x) if x > 0 else str(x))
+
+def format_cap_hit(col):
+    return format_distinct(col, lambda x: '$' + str(int(x)))
+
+def format_time(col):
+    return format_distinct(col, lambda x: str(x // 60) + ':' + str(x % 60).zfill(2))
+
+#Columns that are built from several source columns
+derived_columns = {'name': lambda df: df['firstName'].str.cat(df['lastName'], sep=' ')}
+
+#A view is the ordered source columns to display and the formatter of any column that needs one
+season_stat_columns = ['salary', 'gamesPlayed', 'goals', 'assists', 'points', 'pointsPerGame', 'plusMinus',
+                       'penaltyMinutes', 'shots', 'shootingPercentage', 'avgTimeOnIce',
+                       'powerPlayGoals', 'powerPlayAssists', 'powerPlayPoints', 'avgPowerPlayTimeOnIce',
+                       'shortHandedGoals', 'shortHandedAssists', 'shortHandedPoints', 'avgShortHandedTimeOnIce',
+                       'faceOffWins', 'faceOffLosses', 'faceOffTaken', 'faceOffPercentage',
+                       'hits', 'blocks', 'takeaways', 'giveaways', 'turnoverDifferential']
+display_formatters = {'salary': format_cap_hit, 'plusMinus': format_signed, 'turnoverDifferential': format_signed,
+                      'avgTimeOnIce': format_time, 'avgPowerPlayTimeOnIce': format_time, 'avgShortHandedTimeOnIce': format_time}
+#DataTable formats that show raw numbers like display_formatters, for tables the browser sorts. Times have no m:ss
+#format there and are shown in seconds
+table_formats = {'salary': Format(symbol=Symbol.yes, symbol_prefix='$'), 'plusMinus': Format(sign=Sign.positive),
+                 'turnoverDifferential': Format(sign=Sign.positive)}
+time_columns = {column for column, formatter in display_formatters.items() if formatter is format_time}
+player_view = (['season'] + season_stat_columns, display_formatters)
+league_view = (['name', 'primaryPosition', 'shootsCatches', 'birthDate'] + season_stat_columns, display_formatters)
+
+#Projects a frame through a view. Only the view's columns are touched and the output frame is built once
+def project(df, view):
+    columns, formatters = view
+    projected = {}
+    for column in columns:
+        values = derived_columns[column](df) if column in derived_columns else df[column]
+        if column in formatters:
+            values = formatters[column](values)
+        projected[column_labels[column]] = values
+    return pd.DataFrame(projected, index=df.index)
+
+#DataTables either sort natively in the browser with every row, or page, sort and filter on the server
+server_side_tables = os.environ.get('NHL_TABLE_MODE', 'server') == 'server'
+table_page_size = 50
+
+#Parses one clause of a DataTable filter_query, e.g. '{G} s>= 20' or '{Name} icontains "crosby"'. Returns the column,
+#the operator, the value and whether text comparisons are case sensitive
+filter_operators = [['ge', '>='], ['le', '<='], ['lt', '<'], ['gt', '>'], ['ne', '!='], ['eq', '='],
+                    ['contains'], ['datestartswith']]
+operator_names = {operator: operator_type[0] for operator_type in filter_operators for operator in operator_type}
+#The operator is only looked for right after the column name, never inside the value. Longer operators first, so '>='
+#is not read as '>', and word operators end at a space like in the DataTable's own parser. The DataTable puts 's'
+#(case sensitive) or 'i' (case insensitive) before every operator but datestartswith, from the column's case toggle
+filter_clause = re.compile(r'^\s*\{(.+?)\}\s*([si]?)(' + '|'.join(
+    re.escape(operator) if not operator.isalpha() else operator + r'(?=\s|$)'
+    for operator in sorted(operator_names, key=len, reverse=True)) + r')\s*(.*?)\s*$', re.IGNORECASE)
+def split_filter_part(filter_part):
+    match = filter_clause.match(filter_part)
+    if match is None:
+        return None, None, None, False
+    name, case, operator, value_part = match.groups()
+    operator = operator_names[operator.lower()]
+    v0 = value_part[:1]
+    if len(value_part) > 1 and v0 == value_part[-1] and v0 in ("'", '"', '`'):
+        value = value_part[1: -1].replace('\\' + v0, v0)
+    elif operator in ('contains', 'datestartswith'):
+        #Text operators match the text as typed, '007' is not 7
+        value = value_part
+    else:
+        try:
+            value = float(value_part)
+        except ValueError:
+            value = value_part
+    return name, operator, value, case.lower() == 's'
+
+#Reads a filter value typed the way a cell shows it back into the column's raw units, e.g. '21:55' -> 1315 seconds,
+#'$8700000' -> 8700000, '+20' -> 20. Returns None for text that is not a number
+def parse_display_number(value):
+    text = str(value).strip()
+    minutes, colon, seconds = text.partition(':')
+    try:
+        if colon:
+            return int(minutes) * 60 + int(seconds)
+        return float(text.lstrip('$+'))
+    except ValueError:
+        return None
+
+#A formatted table kept next to its unformatted values. Each stat column has an index that sorts the table by it,
+#built once, so a page request is a filter mask, a gather and a slice no matter how the table is sorted
+class MaterializedTable:
+    def __init__(self, raw_df, display_df):
+        self.records = display_df.to_dict('records')
+        self.values = {label: raw_df[label].to_numpy() for label in raw_df.columns}
+        #Displayed text of numeric columns shown formatted (Cap Hit, +/-, AToI), for text filters
+        self.text = {label: display_df[label].to_numpy() for label in raw_df.columns
+                     if pd.api.types.is_numeric_dtype(raw_df[label]) and not pd.api.types.is_numeric_dtype(display_df[label])}
+        self.order = {label: np.argsort(values, kind='stable') for label, values in self.values.items()}
+        self.columns = [{'name': i, 'id': i, 'deletable': False,
+                         'type': 'numeric' if pd.api.types.is_numeric_dtype(raw_df[i]) else 'text'}
+                        for i in display_df.columns if i != 'id']
+
+    def _filter_mask(self, filter_query):
+        mask = np.ones(len(self.records), dtype=bool)
+        for filter_part in (filter_query or '').split(' && '):
+            name, operator, value, case_sensitive = split_filter_part(filter_part)
+            if name not in self.values:
+                continue
+            values = self.values[name]
+            #Comparisons on numeric columns accept the value as displayed, so '> 20:00' works on AToI
+            if values.dtype != object and isinstance(value, str) and operator not in ('contains', 'datestartswith'):
+                number = parse_display_number(value)
+                if number is not None:
+                    value = number
+            if operator in ('contains', 'datestartswith') or isinstance(value, str) or values.dtype == object:
+                text = pd.Series(self.text.get(name, values)).astype(str)
+                if isinstance(value, float) and value.is_integer():
+                    value = int(value)
+                if operator == 'datestartswith':
+                    mask &= text.str.startswith(str(value)).to_numpy()
+                elif operator in ('eq', 'ne'):
+                    if case_sensitive:
+                        matches = text.to_numpy() == str(value)
+                    else:
+                        matches = text.str.lower().to_numpy() == str(value).lower()
+                    mask &= matches if operator == 'eq' else ~matches
+                else:
+                    mask &= text.str.contains(str(value), case=case_sensitive, regex=False).to_numpy()
+            elif operator == 'ge':
+                mask &= values >= value
+            elif operator == 'le':
+                mask &= values <= value
+            elif operator == 'lt':
+                mask &= values < value
+            elif operator == 'gt':
+                mask &= values > value
+            elif operator == 'ne':
+                mask &= values != value
+            else:
+                mask &= values == value
+        return mask
+
+    #Returns the records on one page, the number of pages after filtering and sorting, and the page shown. A filter
+    #that leaves fewer pages moves a later page back to the last one
+    def page(self, page_current, page_size, sort_by, filter_query):
+        page_current = page_current or 0
+        page_size = page_size or table_page_size
+        if sort_by and sort_by[0]['column_id'] in self.order:
+            rows = self.order[sort_by[0]['column_id']]
+            if sort_by[0]['direction'] == 'desc':
+                rows = rows[::-1]
+        else:
+            rows = np.arange(len(self.records))
+        if filter_query:
+            rows = rows[self._filter_mask(filter_query)[rows]]
+        page_count = max(1, -(-len(rows) // page_size))
+        page_current = min(page_current, page_count - 1)
+        start = page_current * page_size
+        return [self.records[i] for i in rows[start:start + page_size]], page_count, page_current
+
+    #Returns a DataTable showing this table. In server side mode only the first page is sent
+    def datatable(self, id):
+        if not server_side_tables:
+            return dash_table.DataTable(data=self.records, columns=self.columns, id=id,
+                                        sort_action='native', sort_mode='single')
+        records, page_count, _ = self.page(0, table_page_size, [], '')
+        return dash_table.DataTable(data=records, columns=self.columns, id=id,
+                                    page_current=0, page_size=table_page_size, page_count=page_count,
+                                    page_action='custom', sort_action='custom', sort_mode='single',
+                                    filter_action='custom', filter_query='')
+
+#Projects a frame through a view twice, formatted for display and unformatted for sorting and filtering
+def materialize(df, view):
+    columns, _ = view
+    return MaterializedTable(project(df, (columns, {})), project(df, view))
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
@@ -20,280 +482,653 @@ app = Dash(__name__, external_stylesheets=external_stylesheets)
 #Clear the layout and do not display exception till callback gets executed
 app.config.suppress_callback_exceptions = True
 
+#Per-callback timings, payload sizes and cache hit rates on /metrics
+nhl_metrics.install(app.server)
+
+#Slow callbacks can run as background jobs on a local disk-backed queue, so they do not hold a request worker while
+#figures are built. Set NHL_BACKGROUND_CALLBACKS=1 to enable (pip install "dash[diskcache]")
+background_manager = None
+if os.environ.get('NHL_BACKGROUND_CALLBACKS') == '1':
+    import diskcache
+    from dash import DiskcacheManager
+    background_manager = DiskcacheManager(diskcache.Cache(os.environ.get('NHL_JOB_CACHE_DIR', 'job-cache')))
+
+#Reports progress of the running background job. Each job runs in its own process, so slow_callback swaps in the
+#job's progress setter. Outside a background job this does nothing
+def report_progress(done, total):
+    pass
+
+#Registers a slow callback. In background mode it runs as a job with the progress bar and cancel button from
+#job_progress(prefix). Dash cancels a running job when its inputs change again, the cancel button cancels it by hand
+def slow_callback(prefix, *dependencies):
+    def decorator(func):
+        if background_manager is None:
+            return app.callback(*dependencies)(func)
+        @functools.wraps(func)
+        def job(set_progress, *args):
+            global report_progress
+            report_progress = lambda done, total: set_progress((done, total))
+            return func(*args)
+        app.callback(*dependencies,
+                     background=True,
+                     manager=background_manager,
+                     progress=[Output(prefix + '-progress', 'value'), Output(prefix + '-progress', 'max')],
+                     running=[(Output(prefix + '-progress-wrapper', 'style'), {'display': 'block'}, {'display': 'none'})],
+                     cancel=[Input(prefix + '-cancel', 'n_clicks')])(job)
+        return func
+    return decorator
+
+#Graph view figures can be built in the browser from a columnar snapshot of the data that is sent once, so season and
+#strength changes never reach the server. Set NHL_CLIENTSIDE=1 to enable
+clientside_graphs = os.environ.get('NHL_CLIENTSIDE') == '1'
+
+#combinedstats.csv can be checked for changes every NHL_RELOAD_SECONDS seconds and merged in without a restart
+reload_seconds = float(os.environ['NHL_RELOAD_SECONDS']) if os.environ.get('NHL_RELOAD_SECONDS') else None
+
+#Graph view layout around its four figures
+def graph_view(figures):
+    return html.Div([
+        html.H3('Positional Breakdown'),
+        dcc.Graph(
+            id='plot-1',
+            figure=figures.get('plot-1', {})
+        ),
+        html.Br(),
+        html.H3('Goals vs Cap Hit'),
+        html.Div([
+            html.Div([
+                dcc.Graph(
+                id='plot-2',
+                figure=figures.get('plot-2', {})
+                )
+            ], className = 'six columns'),
+            html.Div([
+                dcc.Graph(
+                id='plot-3',
+                figure=figures.get('plot-3', {})
+                )
+            ], className = 'six columns')
+        ], className='row'),
+        dcc.Graph(
+            id='plot-4',
+            figure=figures.get('plot-4', {})
+        ),
+    ])
+
+#Returns the 'id.property' names that triggered the running callback, or [] when called outside of a callback
+def triggered_props():
+    try:
+        return list(ctx.triggered_prop_ids)
+    except MissingCallbackContextException:
+        return []
+
+#Progress bar and cancel button shown while a background job for a slow callback runs
+def job_progress(prefix):
+    if background_manager is None:
+        return html.Div()
+    return html.Div([
+        html.Progress(id=prefix + '-progress'),
+        html.Button('Cancel', id=prefix + '-cancel')
+    ], id=prefix + '-progress-wrapper', style={'display': 'none'})
+
 stats_columns = ['Cap Hit','GP','G','A','P','PPG','+/-','PIM','S','S%','FOL','FOW','FOT', 'FO%',
-            'ToI','ToI PP','PP G','PP A','PP P','ToI SH','SH G','SH A','SH P','HIT','BLK','TK','GV','Turnover Diff']
+            'AToI','ToI','AToI PP','ToI PP','PP G','PP A','PP P','AToI SH','ToI SH','SH G','SH A','SH P','HIT','BLK','TK','GV','Turnover Diff']
 
-seasons = list(data['season'].unique())
-seasons.insert(0, 'All')
+#Seasons in the dataset, and with 'All' for the graph view. Filled by refresh_seasons
+season_options = []
+seasons = []
 strength = ['All', 'EV', 'PP', 'SH']
+#Graph view inputs with figures
+graph_keys = set()
+
+#Updates the season lists the callbacks and dropdowns read from a dataset's rows
+def refresh_seasons(frame):
+    season_options[:] = [str(season) for season in frame['season'].unique()]
+    seasons[:] = ['All'] + season_options
+    keys = {(season, strength_value) for season in seasons for strength_value in strength}
+    graph_keys.update(keys)
+    graph_keys.intersection_update(keys)
+
+dataset_lock = threading.Lock()
+
+#Loads the dataset, its name index and season lists, and opens the SQL backend. Runs once, concurrent first requests
+#wait for the same load
+def load_data():
+    global dataset
+    with dataset_lock:
+        if dataset is not None:
+            return
+        frame = nhl_store.load(csv_path)
+        signature = nhl_store.read_meta(store_path)['source']
+        database = nhl_sql.connect(csv_path) if sql_backend else None
+        refresh_seasons(frame)
+        dataset = Dataset(frame, PlayerNameIndex(frame), nhl_store.read_line_hashes(store_path), signature,
+                          dataset_version(signature), database, 0)
+
+#Returns the current dataset, loading it on first use. Read it once per callback, a reload may swap in another
+def get_dataset():
+    if dataset is None:
+        load_data()
+    return dataset
+
+#Returns the rows of the current dataset
+def get_data():
+    return get_dataset().data
+
+#Returns the player name index of the current dataset
+def get_player_index():
+    return get_dataset().player_index
+
+#Swaps in a new dataset with one assignment and updates the season lists from it
+def swap_dataset(frame, index, hashes, signature, version, database):
+    global dataset
+    current = get_dataset()
+    refresh_seasons(frame)
+    dataset = Dataset(frame, index, hashes, signature, version, database, current.generation + 1)
+
+if not lazy_start:
+    load_data()
+
+#Contents of each tab. Built with the layout, or the first time the tab is opened with NHL_LAZY_START=1
+def player_tab():
+    return [
+        html.H3('Search By Player'),
+        dcc.Textarea(
+            id='search',
+            placeholder='Enter Player Name',
+            value='Sidney Crosby',
+            style={'width': '30%', 'height': '20px', 'resize': 'none'},
+            draggable='false'
+        ),
+        html.H3('Allow Multiple Players'),
+        html.Div([
+            dcc.Dropdown(
+                id='compare-players',
+                options=[],
+                value=[],
+                multi=True,
+                placeholder='Search players to compare'
+            ),
+            dcc.Dropdown(
+                id='compare-stat',
+                options=stats_columns,
+                value='P',
+                clearable=False
+            ),
+            html.Div(id='compare-output-wrapper'),
+        ], id='player-names-wrapper'),
+        html.Div(id='player-info-output-wrapper'),
+        html.Div(id='stats-output-wrapper'),
+    ]
+
+def summary_tab():
+    return [
+        html.H3('Select A Category'),
+        dcc.Dropdown(
+            id='stats-select',
+            options=stats_columns,
+            value=stats_columns[0]
+        ),
+        dcc.Input(
+            id='stat-min',
+            type='number',
+            placeholder='Minimum value (Inclusive)',
+            style={'height': '30px', 'width': '10%'}
+        ),
+        dcc.Input(
+            id='stat-max',
+            type='number',
+            placeholder='Maximum value (Inclusive)',
+            style={'height': '30px', 'width': '10%'}
+        ),
+        job_progress('league'),
+        html.Div(id='league-output-wrapper'),
+    ]
+
+def raw_data_tab():
+    get_data()
+    return [
+        html.H3('Select A Season'),
+        dcc.Dropdown(
+            id='season-select-1',
+            options=season_options,
+            value=season_options[0]
+        ),
+        html.Div(id='raw-data-output-wrapper'),
+    ]
+
+def graph_tab():
+    get_data()
+    return [
+        html.H3('Select A Season'),
+        dcc.Dropdown(
+            id='season-select-2',
+            options=seasons,
+            value=seasons[0]
+        ),
+        html.H3('Select Strength'),
+        dcc.Dropdown(
+            id='strength-select-2',
+            options=strength,
+            value=strength[0]
+        ),
+        job_progress('graph'),
+        dcc.Store(id='graph-snapshot'),
+        dcc.Store(id='graph-snapshot-version'),
+        html.Div(graph_view({}) if clientside_graphs else None, id='graph-output-wrapper'),
+    ]
+
+#Tab label, component id and content builder of each tab
+tabs = [('Player Stats Browser', 'player-tab', player_tab),
+        ('Data Summary', 'summary-tab', summary_tab),
+        ('Raw Data Viewer', 'raw-data-tab', raw_data_tab),
+        ('Graph View', 'graph-tab', graph_tab)]
 
 app.layout = html.Div([
     html.Div([
         html.Div(id='dummy'),
         html.H1('NHL Data Visualization'),
         dcc.Tabs(id='tabs-example-graph', value='Player Stats Browser', children=[
-            dcc.Tab(label='Player Stats Browser', value='Player Stats Browser', children=[
-                html.H3('Search By Player'),
-                dcc.Textarea(
-                    id='search',
-                    placeholder='Enter Player Name',
-                    value='Sidney Crosby',
-                    style={'width': '30%', 'height': '20px', 'resize': 'none'},
-                    draggable='false'
-                ),
-                html.H3('Allow Multiple Players'),
-                html.Div(id='player-names-wrapper'),
-                html.Div(id='player-info-output-wrapper'),
-                html.Div(id='stats-output-wrapper'),
-            ]),
-            dcc.Tab(label='Data Summary', value='Data Summary', children=[
-                html.H3('Select A Category'),
-                dcc.Dropdown(
-                    id='stats-select',
-                    options=stats_columns,
-                    value=stats_columns[0]
-                ),
-                dcc.Input(
-                    id='stat-min',
-                    type='number',
-                    placeholder='Minimum value (Inclusive)',
-                    style={'height': '30px', 'width': '10%'}
-                ),
-                dcc.Input(
-                    id='stat-max',
-                    type='number',
-                    placeholder='Maximum value (Inclusive)',
-                    style={'height': '30px', 'width': '10%'}
-                ),
-                html.Div(id='league-output-wrapper'),
-            ]),
-            dcc.Tab(label='Raw Data Viewer', value='Raw Data Viewer', children=[
-                html.H3('Select A Season'),
-                dcc.Dropdown(
-                    id='season-select-1',
-                    options=data['season'].unique(),
-                    value=data['season'].unique()[0]
-                ),
-                html.Div(id='raw-data-output-wrapper'),
-            ]),
-            dcc.Tab(label='Graph View', value='Graph View', children=[
-                html.H3('Select A Season'),
-                dcc.Dropdown(
-                    id='season-select-2',
-                    options=seasons,
-                    value=seasons[0]
-                ),
-                html.H3('Select Strength'),
-                dcc.Dropdown(
-                    id='strength-select-2',
-                    options=strength,
-                    value=strength[0]
-                ),
-                html.Div(id='graph-output-wrapper'),
-            ]),
+            dcc.Tab(label=label, value=label, id=tab_id, children=None if lazy_start else build())
+            for label, tab_id, build in tabs
         ]),
-        html.Div(id='tabs-content-example-graph')
+        html.Div(id='tabs-content-example-graph'),
+        #Labels of the tabs built so far with NHL_LAZY_START=1
+        dcc.Store(id='built-tabs', data=[]),
+        dcc.Interval(id='season-refresh', interval=(reload_seconds or 60) * 1000, disabled=reload_seconds is None)
     ], style={'display':'block'})
 ])
 
-#Callback for player info. Takes player name as input. Outputs text for position, handedness, birth date of player
+if lazy_start:
+    #Callback for building tabs. Takes the active tab as input. Outputs the tab's content the first time it is opened.
+    #Built tabs are tracked by label, their content is never sent back to the server
+    @app.callback(
+        [Output(tab_id, 'children') for _, tab_id, _ in tabs] + [Output('built-tabs', 'data')],
+        Input('tabs-example-graph', 'value'),
+        State('built-tabs', 'data'))
+    def build_tab(tab, built):
+        built = built or []
+        if tab in built:
+            return [no_update] * (len(tabs) + 1)
+        return [build() if label == tab else no_update for label, _, build in tabs] + [built + [tab]]
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+#Memoizes a function of the dataset like functools.lru_cache, and can also drop the entry for one set of arguments with
+#cache_forget(*args) when the rows it was built from change. Values are computed outside the lock, so a value that
+#finishes after a reload swapped in a newer dataset is returned but not kept, it may have been built from old rows
+def keyed_cache(maxsize=None):
+    def decorator(func):
+        entries = OrderedDict()
+        counts = [0, 0]
+        lock = threading.Lock()
+        @functools.wraps(func)
+        def wrapper(*args):
+            with lock:
+                if args in entries:
+                    entries.move_to_end(args)
+                    counts[0] += 1
+                    return entries[args]
+                counts[1] += 1
+            generation = get_dataset().generation
+            value = func(*args)
+            with lock:
+                if get_dataset().generation == generation:
+                    entries[args] = value
+                    if maxsize is not None and len(entries) > maxsize:
+                        entries.popitem(last=False)
+            return value
+        def cache_forget(*args):
+            with lock:
+                entries.pop(args, None)
+        def cache_clear():
+            with lock:
+                entries.clear()
+                counts[:] = [0, 0]
+        wrapper.cache_forget = cache_forget
+        wrapper.cache_clear = cache_clear
+        wrapper.cache_info = lambda: CacheInfo(counts[0], counts[1], maxsize, len(entries))
+        return wrapper
+    return decorator
+
+#Builds the info header fields and the materialized season table for one player. Both outputs of the
+#player stats browser come from this single pass, and the result is kept in a bounded LRU cache keyed by player_id.
+#Returns None for a player a reload removed after the search resolved them
+@keyed_cache(maxsize=256)
+@nhl_metrics.timed('pandas')
+def player_profile(player_id):
+    current = get_dataset()
+    if player_id not in current.player_index.rows:
+        return None
+    player_df = current.data.iloc[current.player_index.player_rows(player_id)]
+    info = {
+        'primaryPosition': player_df['primaryPosition'].iloc[0],
+        'shootsCatches': player_df['shootsCatches'].iloc[0],
+        'birthDate': player_df['birthDate'].iloc[0]
+    }
+    return info, materialize(player_df, player_view)
+
+#Callback for player stats browser. Takes player name as input. Outputs text for position, handedness, birth date of player
+#and a datatable of the player's seasons
 @app.callback(
     Output('player-info-output-wrapper', 'children'),
+    Output('stats-output-wrapper', 'children'),
     Input('search', 'value'))
+@nhl_metrics.instrument
 def render_stats(name):
-    #Split search into first and last name
-    name = name.lower()
-    fname = name.split()[0]
-    lname = name.split()[1]
-    #Filter by first and last name to find specific player
-    info_df = data.filter(['firstName', 'lastName', 'primaryPosition', 'shootsCatches', 'birthDate'])
-    info_df = info_df[info_df['firstName'].str.lower() == fname]
-    info_df = info_df[info_df['lastName'].str.lower() == lname]
-    return html.Div([
+    #Resolve the search text to a single player through the name index. The best match is the first suggestion, so
+    #the index is searched once for both
+    player_index = get_player_index()
+    options = player_index.suggest(name or '', limit=5)
+    player_id = options[0]['value'] if options else None
+    profile = player_profile(player_id) if player_id is not None else None
+    if profile is None:
+        return html.Div([html.H5('No player found matching "' + str(name or '') + '"')]), html.Div()
+    info, table = profile
+    #Offer close matches when the search text was not an exact name, and every player of that name when several
+    #share it. Their labels carry the birth year, which picks one when added to the search
+    suggestions = []
+    namesakes = player_index.namesakes(name)
+    if len(namesakes) > 1:
+        suggestions = [html.P('Several players are named ' + name.strip() + ', add the birth year to pick one: ' +
+                              ', '.join(option['label'] for option in namesakes))]
+    elif not namesakes:
+        suggestions = [html.P('Did you mean: ' + ', '.join(option['label'] for option in options))]
+    info_div = html.Div(suggestions + [
         html.H5([
-            'Position: ' + info_df['primaryPosition'].iloc[0], html.Hr(),
-            'Shoots: ' + info_df['shootsCatches'].iloc[0], html.Hr(),
-            'Date of Birth: ' + info_df['birthDate'].iloc[0], html.Hr()
+            'Position: ' + info['primaryPosition'], html.Hr(),
+            'Shoots: ' + info['shootsCatches'], html.Hr(),
+            'Date of Birth: ' + info['birthDate'], html.Hr()
         ])
     ])
+    stats_div = html.Div([table.datatable('player-tbl')])
+    return info_div, stats_div
 
-#Callback for individual player stat viewer. Takes player name as input. Outputs text with datatable
+#Server side paging for the player stats browser. Takes page, sort and filter state of the table. Outputs one page of
+#rows, the page count and the page shown
 @app.callback(
-    Output('stats-output-wrapper', 'children'),
-    Input('search', 'value'))
-def render_stats(inputName):
-    #Find player by first/last name
-    stats_df = data.drop(['player_id', 'birthDate', 'primaryPosition', 'shootsCatches'], axis=1)
-    name = inputName.lower()
-    fname = name.split()[0]
-    lname = name.split()[1]
-    stats_df = stats_df[stats_df['firstName'].str.lower() == fname]
-    stats_df = stats_df[stats_df['lastName'].str.lower() == lname]
-    #Format columns to be displayed
-    stats_df['plusMinus'] = stats_df['plusMinus'].apply(lambda x: '+' + str(x) if x > 0 else str(x))
-    stats_df['turnoverDifferential'] = stats_df['turnoverDifferential'].apply(lambda x: '+' + str(x) if x > 0 else str(x))
-    stats_df['capHit'] = stats_df['salary'].apply(lambda x: '$' + str(int(x)))
-    stats_df.drop(['timeOnIce', 'powerPlayTimeOnIce', 'shortHandedTimeOnIce'], axis=1, inplace=True)
-    stats_df.rename(columns={'season': 'Season',
-                             'capHit': 'Cap Hit',
-                             'gamesPlayed': 'GP',
-                             'goals': 'G',
-                             'assists': 'A',
-                             'points': 'P',
-                             'pointsPerGame': 'PPG',
-                             'plusMinus': '+/-',
-                             'penaltyMinutes': 'PIM',
-                             'shots': 'S',
-                             'shootingPercentage': 'S%',
-                             'faceOffLosses': 'FOL',
-                             'faceOffWins': 'FOW',
-                             'faceOffTaken': 'FOT',
-                             'faceOffPercentage': 'FO%',
-                             'avgTimeOnIce': 'AToI',
-                             'avgPowerPlayTimeOnIce': 'AToI PP',
-                             'powerPlayGoals': 'PP G',
-                             'powerPlayAssists': 'PP A',
-                             'powerPlayPoints': 'PP P',
-                             'avgShortHandedTimeOnIce': 'AToI SH',
-                             'shortHandedGoals': 'SH G',
-                             'shortHandedAssists': 'SH A',
-                             'shortHandedPoints': 'SH P',
-                             'hits': 'HIT',
-                             'blocks': 'BLK',
-                             'takeaways': 'TK',
-                             'giveaways': 'GV',
-                             'turnoverDifferential': 'Turnover Diff'}, inplace=True)
-    stats_df = stats_df[['Season', 'Cap Hit', 'GP', 'G', 'A', 'P', 'PPG', '+/-', 'PIM', 'S', 'S%', 'AToI',
-                         'PP G', 'PP A', 'PP P', 'AToI PP', 'SH G', 'SH A', 'SH P', 'AToI SH',
-                         'FOW', 'FOL', 'FOT', 'FO%', 'HIT', 'BLK', 'TK', 'GV', 'Turnover Diff']]
-    return html.Div([
-        dash_table.DataTable(
-            data=stats_df.to_dict('records'),
-            columns=[{'name': i, 'id': i, 'deletable': False} for i in stats_df.columns
-                if i != 'id'],
-            id='player-tbl',
-            sort_action='native',
-            sort_mode='single'
-        )
+    Output('player-tbl', 'data'),
+    Output('player-tbl', 'page_count'),
+    Output('player-tbl', 'page_current'),
+    Input('player-tbl', 'page_current'),
+    Input('player-tbl', 'page_size'),
+    Input('player-tbl', 'sort_by'),
+    Input('player-tbl', 'filter_query'),
+    State('search', 'value'),
+    prevent_initial_call=True)
+@nhl_metrics.instrument
+def page_player_table(page_current, page_size, sort_by, filter_query, name):
+    player_id = get_player_index().lookup(name or '')
+    profile = player_profile(player_id) if player_id is not None else None
+    if profile is None:
+        return no_update, no_update, no_update
+    return profile[1].page(page_current, page_size, sort_by, filter_query)
+
+#Most players compared at once
+max_compared_players = 40
+
+#Callback for the player comparison search. Takes the search text as input. Outputs name suggestions from the name
+#index together with the players already selected, which the dropdown needs to keep showing
+@app.callback(
+    Output('compare-players', 'options'),
+    Input('compare-players', 'search_value'),
+    State('compare-players', 'value'))
+@nhl_metrics.instrument
+def suggest_players(search_value, selected):
+    selected = selected or []
+    player_index = get_player_index()
+    options = player_index.options(selected)
+    if search_value:
+        options += [option for option in player_index.suggest(search_value) if option['value'] not in selected]
+    return options
+
+#Callback for the player comparison. Takes the selected players and a stat category as input. Outputs a table and an
+#overlay chart of the stat for each player, aligned by season. The players' rows are gathered through the player_id
+#index in one pass, so the cost depends on the players selected and not on the size of the dataset
+@app.callback(
+    Output('compare-output-wrapper', 'children'),
+    Input('compare-players', 'value'),
+    Input('compare-stat', 'value'))
+@nhl_metrics.instrument
+def render_comparison(selected, stat):
+    selected = [int(player_id) for player_id in (selected or [])]
+    if not selected or stat not in label_columns:
+        return html.Div()
+    notes = []
+    if len(selected) > max_compared_players:
+        notes.append(html.P('Comparing the first ' + str(max_compared_players) + ' players'))
+        selected = selected[:max_compared_players]
+    current = get_dataset()
+    player_index = current.player_index
+    with nhl_metrics.phase('pandas'):
+        rows, owners = player_index.players_rows(selected)
+        if len(rows) == 0:
+            return html.Div(notes)
+        frame = current.data.iloc[rows]
+        column = label_columns[stat]
+        seasons_played = frame['season'].astype(str).to_numpy()
+        raw = pd.DataFrame({'Season': seasons_played, 'player': owners, 'value': frame[column].to_numpy()})
+        #One row per season, one column per player
+        aligned = raw.pivot(index='Season', columns='player', values='value').sort_index()
+        options = player_index.options(selected)
+        players = [option['value'] for option in options if option['value'] in aligned.columns]
+        labels = {option['value']: option['label'] for option in options}
+        #Cells keep the raw numbers so the browser sorts them as numbers, the column format shows them like the other
+        #tables. Seasons a player did not play are left blank
+        table = aligned.reindex(columns=players).astype(object)
+        table = table.where(table.notna(), None)
+        table.columns = [str(player_id) for player_id in players]
+        records = table.reset_index().to_dict('records')
+    title = stat + ' (seconds)' if column in time_columns else stat
+    with nhl_metrics.phase('figure'):
+        traces = []
+        for player_id in players:
+            values = aligned[player_id]
+            traces.append({'type': 'scatter', 'mode': 'lines+markers', 'name': labels[player_id],
+                           'x': list(aligned.index), 'y': [None if pd.isna(value) else value for value in values.tolist()]})
+        figure = {'data': traces, 'layout': {'xaxis': {'title': {'text': 'Season'}, 'type': 'category'},
+                                             'yaxis': {'title': {'text': title}}, 'hovermode': 'x unified'}}
+    #The stat and its unit head the player columns
+    columns = [{'name': ['', 'Season'], 'id': 'Season'}]
+    for player_id in players:
+        columns.append({'name': [title, labels[player_id]], 'id': str(player_id), 'type': 'numeric'})
+        if column in table_formats:
+            columns[-1]['format'] = table_formats[column]
+    return html.Div(notes + [
+        dash_table.DataTable(data=records, columns=columns, id='compare-tbl', sort_action='native',
+                             merge_duplicate_headers=True),
+        dcc.Graph(figure=figure)
     ])
 
+#Builds the formatted table for one season, including its serialized records and sort indexes. The dataset is static
+#between deploys, so each season is materialized once and later season switches are a cache lookup
+@keyed_cache(maxsize=None)
+@nhl_metrics.timed('pandas')
+def season_table(season):
+    current = get_dataset()
+    #Minimum games played
+    if current.stats_db is not None:
+        stats_df = current.stats_db.season_rows(season, 10)
+    else:
+        stats_df = current.data[current.data['season'] == season]
+        stats_df = stats_df[stats_df['gamesPlayed'] > 10]
+    #Format +/-, turnover differential, cap hit. Rename, reorder columns
+    return materialize(stats_df, league_view)
+
 #Callback for raw data viewer. Takes season as input. Outputs datatable
 @app.callback(
     Output('raw-data-output-wrapper', 'children'),
     Input('season-select-1', 'value'))
+@nhl_metrics.instrument
 def render_radio(season): 
-    stats_df = data[data['season'] == season]
-    #Minimum games played
-    stats_df = stats_df[stats_df['gamesPlayed'] > 10]
-    #Format +/-, turnover differential, cap hit
-    stats_df['plusMinus'] = stats_df['plusMinus'].apply(lambda x: '+' + str(x) if x > 0 else str(x))
-    stats_df['turnoverDifferential'] = stats_df['turnoverDifferential'].apply(lambda x: '+' + str(x) if x > 0 else str(x))
-    stats_df['capHit'] = stats_df['salary'].apply(lambda x: '$' + str(int(x)))
-    stats_df['Name'] = stats_df['firstName'].str.cat(stats_df['lastName'], sep=' ')
-    stats_df.drop(['player_id', 'timeOnIce', 'powerPlayTimeOnIce', 'shortHandedTimeOnIce', 'firstName', 'lastName', 'season'], axis=1, inplace=True)
-    #Rename, reorder columns
-    stats_df.rename(columns={'Name': 'Name',
-                             'birthDate': 'DoB',
-                             'primaryPosition': 'Position',
-                             'shootsCatches': 'Shoots',
-                             'capHit': 'Cap Hit',
-                             'gamesPlayed': 'GP',
-                             'goals': 'G',
-                             'assists': 'A',
-                             'points': 'P',
-                             'pointsPerGame': 'PPG',
-                             'plusMinus': '+/-',
-                             'penaltyMinutes': 'PIM',
-                             'shots': 'S',
-                             'shootingPercentage': 'S%',
-                             'faceOffLosses': 'FOL',
-                             'faceOffWins': 'FOW',
-                             'faceOffTaken': 'FOT',
-                             'faceOffPercentage': 'FO%',
-                             'avgTimeOnIce': 'AToI',
-                             'avgPowerPlayTimeOnIce': 'AToI PP',
-                             'powerPlayGoals': 'PP G',
-                             'powerPlayAssists': 'PP A',
-                             'powerPlayPoints': 'PP P',
-                             'avgShortHandedTimeOnIce': 'AToI SH',
-                             'shortHandedGoals': 'SH G',
-                             'shortHandedAssists': 'SH A',
-                             'shortHandedPoints': 'SH P',
-                             'hits': 'HIT',
-                             'blocks': 'BLK',
-                             'takeaways': 'TK',
-                             'giveaways': 'GV',
-                             'turnoverDifferential': 'Turnover Diff'}, inplace=True)
-    stats_df = stats_df[['Name', 'Position', 'Shoots', 'DoB', 'Cap Hit', 'GP', 'G', 'A', 'P', 'PPG', '+/-', 'PIM', 'S', 'S%', 'AToI',
-                         'PP G', 'PP A', 'PP P', 'AToI PP', 'SH G', 'SH A', 'SH P', 'AToI SH',
-                         'FOW', 'FOL', 'FOT', 'FO%', 'HIT', 'BLK', 'TK', 'GV', 'Turnover Diff']]
-    return html.Div([
-        dash_table.DataTable(
-            data=stats_df.to_dict('records'),
-            columns=[{'name': i, 'id': i, 'deletable': False} for i in stats_df.columns
-                if i != 'id'],
-            id='league-tbl',
-            sort_action='native',
-            sort_mode='single'
-        )
-    ])
+    return html.Div([season_table(season).datatable('league-tbl')])
+
+#Server side paging for the raw data viewer. Takes page, sort and filter state of the table. Outputs one page of rows,
+#the page count and the page shown
+@app.callback(
+    Output('league-tbl', 'data'),
+    Output('league-tbl', 'page_count'),
+    Output('league-tbl', 'page_current'),
+    Input('league-tbl', 'page_current'),
+    Input('league-tbl', 'page_size'),
+    Input('league-tbl', 'sort_by'),
+    Input('league-tbl', 'filter_query'),
+    State('season-select-1', 'value'),
+    prevent_initial_call=True)
+@nhl_metrics.instrument
+def page_league_table(page_current, page_size, sort_by, filter_query, season):
+    return season_table(season).page(page_current, page_size, sort_by, filter_query)
+
+#Summary of one stat column for the data summary tab, built from the column's distinct values in ascending order and
+#how often each occurs. Positions index the column as if it were sorted, so a min/max range is two binary searches,
+#and histogram bins are counted once so any range is re-binned without a scan. A column has few distinct values even
+#when it has millions of rows, so the SQL backend only sends those. Figures are built from these aggregates as plain
+#dicts, skipping plotly's per-property validation
+class StatSummary:
+    def __init__(self, values, counts, max_bins=100, max_points=1000):
+        self.max_points = max_points
+        self.values = np.asarray(values, dtype='float64')
+        self.counts = np.asarray(counts, dtype=np.int64)
+        #Position in the sorted column of the first copy of each distinct value, and one past the end
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)])
+        self.count = int(self.offsets[-1])
+        self.stats = self._describe()
+        if self.count == 0:
+            self.edges = np.array([0.0, 1.0])
+        elif np.all(self.values == np.round(self.values)):
+            #Integer stats get integer width bins centred on the values
+            width = np.ceil((self.values[-1] - self.values[0] + 1) / max_bins)
+            self.edges = np.arange(self.values[0] - 0.5, self.values[-1] + width, width)
+        else:
+            self.edges = self._auto_edges()
+            if len(self.edges) > max_bins + 1:
+                self.edges = np.linspace(self.values[0], self.values[-1], max_bins + 1)
+        #Number of values below each bin edge, the last edge is inclusive
+        self.below = self._position(self.edges, 'left')
+        self.below[-1] = self._position(self.edges[-1], 'right')
+
+    #Number of values below (left) or at and below (right) a value
+    def _position(self, value, side):
+        return self.offsets[np.searchsorted(self.values, value, side=side)]
+
+    #Values at positions of the sorted column
+    def _value(self, position):
+        return self.values[np.searchsorted(self.offsets, position, side='right') - 1]
+
+    #Same fields as Series.describe() on the column
+    def _describe(self):
+        if self.count == 0:
+            return pd.Series(dtype='float64').describe()
+        mean = np.dot(self.values, self.counts) / self.count
+        std = np.sqrt(np.dot(self.counts, (self.values - mean) ** 2) / (self.count - 1)) if self.count > 1 else np.nan
+        return pd.Series({'count': float(self.count), 'mean': mean, 'std': std, 'min': self.values[0],
+                          '25%': self._quantile(0, self.count, 0.25), '50%': self._quantile(0, self.count, 0.5),
+                          '75%': self._quantile(0, self.count, 0.75), 'max': self.values[-1]})
+
+    #np.histogram_bin_edges(values, bins='auto'), from the quartiles instead of the whole column
+    def _auto_edges(self):
+        first, last = self.values[0], self.values[-1]
+        width = (last - first) / (np.log2(self.count) + 1.0)
+        freedman_diaconis = 2.0 * (self._quantile(0, self.count, 0.75) - self._quantile(0, self.count, 0.25)) * self.count ** (-1.0 / 3.0)
+        if freedman_diaconis:
+            width = min(freedman_diaconis, width)
+        if first == last:
+            first, last = first - 0.5, last + 0.5
+        bins = int(np.ceil((last - first) / width)) if width else 1
+        return np.linspace(first, last, bins + 1)
+
+    #Returns the [start, stop) positions in the sorted values of an inclusive min/max range
+    def range(self, min_val, max_val):
+        return int(self._position(min_val, 'left')), int(self._position(max_val, 'right'))
+
+    #Linear interpolated quantile of the sorted values in [start, stop)
+    def _quantile(self, start, stop, q):
+        pos = start + q * (stop - start - 1)
+        low = int(np.floor(pos))
+        high = min(low + 1, stop - 1)
+        low_value, high_value = self._value(low), self._value(high)
+        return low_value + (pos - low) * (high_value - low_value)
+
+    #Histogram of the values in [start, stop), re-binned from the precomputed counts
+    @nhl_metrics.timed('figure')
+    def histogram(self, start, stop, label):
+        counts = np.diff(np.clip(self.below, start, stop))
+        used = np.nonzero(counts)[0]
+        traces = []
+        if len(used):
+            bins = slice(used[0], used[-1] + 1)
+            traces.append({'type': 'bar', 'x': (self.edges[:-1] + self.edges[1:])[bins] / 2, 'y': counts[bins],
+                           'width': np.diff(self.edges)[bins], 'name': label})
+        return {'data': traces, 'layout': {'bargap': 0, 'xaxis': {'title': {'text': label}},
+                                           'yaxis': {'title': {'text': 'count'}}}}
+
+    #Box plot of the values in [start, stop) drawn from its quartiles and fences. Only the outliers are sent as points
+    @nhl_metrics.timed('figure')
+    def box(self, start, stop, label):
+        traces = []
+        if stop > start:
+            q1, median, q3 = (self._quantile(start, stop, q) for q in (0.25, 0.5, 0.75))
+            iqr = q3 - q1
+            low_stop = int(np.clip(self._position(q1 - 1.5 * iqr, 'left'), start, stop))
+            high_start = int(np.clip(self._position(q3 + 1.5 * iqr, 'right'), start, stop))
+            #Copies of each distinct value inside the range
+            counts = np.diff(np.clip(self.offsets, start, stop))
+            traces.append({'type': 'box', 'orientation': 'h', 'y': [label], 'name': label, 'boxpoints': False,
+                           'q1': [q1], 'median': [median], 'q3': [q3],
+                           'lowerfence': [self._value(low_stop)], 'upperfence': [self._value(high_start - 1)],
+                           'mean': [np.dot(self.values, counts) / (stop - start)]})
+            low_count = low_stop - start
+            outlier_count = low_count + stop - high_start
+            points = np.arange(outlier_count)
+            if outlier_count > self.max_points:
+                points = np.linspace(0, outlier_count - 1, self.max_points).astype(int)
+            outliers = self._value(np.where(points < low_count, start + points, high_start + points - low_count))
+            if len(outliers):
+                traces.append({'type': 'scatter', 'mode': 'markers', 'x': outliers, 'y': [label] * len(outliers),
+                               'name': 'outliers'})
+        return {'data': traces, 'layout': {'xaxis': {'title': {'text': label}}, 'showlegend': False}}
+
+#Builds the summary for a stat category once
+@keyed_cache(maxsize=None)
+@nhl_metrics.timed('pandas')
+def stat_summary(stat):
+    current = get_dataset()
+    if current.stats_db is not None:
+        values, counts = current.stats_db.value_counts(label_columns[stat])
+    else:
+        values, counts = np.unique(current.data[label_columns[stat]].to_numpy(), return_counts=True)
+    return StatSummary(values, counts)
 
 #Callback for data summary. Takes stat category as input. Takes minimum and maximum values as input.
 #Output descriptive statistics. Output histogram. Output box & whisker plot.
-@app.callback(
+@slow_callback('league',
     Output('league-output-wrapper', 'children'),
     Input('stats-select', 'value'),
     Input('stat-min', 'value'),
     Input('stat-max', 'value'))
+@nhl_metrics.instrument
 def render_overview(stat, min_val, max_val):
-    stats_df = data.copy()
-    #Filter, rename and reorder columns
-    stats_df.drop(['player_id', 'firstName', 'lastName', 'season', 'shootsCatches', 'primaryPosition'], axis=1, inplace=True)
-    stats_df.rename(columns={'salary': 'Cap Hit',
-                             'gamesPlayed': 'GP',
-                             'goals': 'G',
-                             'assists': 'A',
-                             'points': 'P',
-                             'pointsPerGame': 'PPG',
-                             'plusMinus': '+/-',
-                             'penaltyMinutes': 'PIM',
-                             'shots': 'S',
-                             'shootingPercentage': 'S%',
-                             'faceOffLosses': 'FOL',
-                             'faceOffWins': 'FOW',
-                             'faceOffTaken': 'FOT',
-                             'faceOffPercentage': 'FO%',
-                             'avgTimeOnIce': 'AToI',
-                             'timeOnIce': 'ToI',
-                             'avgPowerPlayTimeOnIce': 'AToI PP',
-                             'powerPlayTimeOnIce': 'ToI PP',
-                             'powerPlayGoals': 'PP G',
-                             'powerPlayAssists': 'PP A',
-                             'powerPlayPoints': 'PP P',
-                             'avgShortHandedTimeOnIce': 'AToI SH',
-                             'shortHandedTimeOnIce': 'ToI SH',
-                             'shortHandedGoals': 'SH G',
-                             'shortHandedAssists': 'SH A',
-                             'shortHandedPoints': 'SH P',
-                             'hits': 'HIT',
-                             'blocks': 'BLK',
-                             'takeaways': 'TK',
-                             'giveaways': 'GV',
-                             'turnoverDifferential': 'Turnover Diff'}, inplace=True)
-    stats_df = stats_df[['Cap Hit', 'GP', 'G', 'A', 'P', 'PPG', '+/-', 'PIM', 'S', 'S%', 'AToI', 'ToI',
-                         'PP G', 'PP A', 'PP P', 'AToI PP', 'ToI PP', 'SH G', 'SH A', 'SH P', 'AToI SH', 'ToI SH',
-                         'FOW', 'FOL', 'FOT', 'FO%', 'HIT', 'BLK', 'TK', 'GV', 'Turnover Diff']]
-    
+    summary = stat_summary(stat)
+    report_progress(1, 3)
     #Get descriptive statistics
-    stats = stats_df[stat].describe()
+    stats = summary.stats
     #Set default values for min and max values
     if (min_val == None):
          min_val = -100
     if (max_val == None):
         max_val = stats['max']
-    #Apply min and max mask to dataframe
-    mask = (stats_df[stat] >= min_val) & (stats_df[stat] <= max_val)
-    stats_df = stats_df[mask]
+    #Find the min and max range in the sorted values
+    start, stop = summary.range(min_val, max_val)
+    histogram = summary.histogram(start, stop, stat)
+    report_progress(2, 3)
+    box = summary.box(start, stop, stat)
+    #Only the range changed. The statistics on the page still hold, so patch just the two figures
+    triggered = triggered_props()
+    if triggered and set(triggered) <= {'stat-min.value', 'stat-max.value'}:
+        patch = Patch()
+        patch['props']['children'][8]['props']['figure'] = histogram
+        patch['props']['children'][9]['props']['figure'] = box
+        return patch
     return html.Div([
         html.H4('Count: ' + str(stats['count'].round(0))),
         html.H4('Mean: ' + str(stats['mean'].round(0))),
@@ -303,22 +1138,17 @@ def render_overview(stat, min_val, max_val):
         html.H4('25% IQR: ' + str(stats['25%'])),
         html.H4('50% IQR: ' + str(stats['50%'])),
         html.H4('75% IQR: ' + str(stats['75%'])),
-        dcc.Graph(figure=px.histogram(stats_df, x=stat)),
-        dcc.Graph(figure=px.box(stats_df, x=stat, points='all'))
+        dcc.Graph(figure=histogram),
+        dcc.Graph(figure=box)
     ])
 
-#Callback for raw data viewer. Takes strength and season as input. Outputs multiple graph objects
-@app.callback(
-    Output('graph-output-wrapper', 'children'),
-    Input('season-select-2', 'value'),
-    Input('strength-select-2', 'value'))
-def render_graph(season, strength):
-    plot_df = data.filter(['gamesPlayed', 'salary', 'goals', 'assists', 'points', 'primaryPosition', 'season',
+#Graph view columns with goals, assists and points derived for one strength. Computed once per strength
+@keyed_cache(maxsize=None)
+@nhl_metrics.timed('pandas')
+def strength_frame(strength):
+    plot_df = get_data().filter(['gamesPlayed', 'salary', 'goals', 'assists', 'points', 'primaryPosition', 'season',
                            'powerPlayGoals', 'powerPlayAssists', 'powerPlayPoints',
                            'shortHandedGoals', 'shortHandedAssists', 'shortHandedPoints'])
-    #Filter based on selections
-    if season != 'All':
-        plot_df = plot_df[plot_df['season'] == season]
     if strength == 'EV':
         plot_df['goals'] = plot_df['goals'] - plot_df['powerPlayGoals'] - plot_df['shortHandedGoals']
         plot_df['assists'] = plot_df['assists'] - plot_df['powerPlayAssists'] - plot_df['shortHandedAssists']
@@ -331,83 +1161,191 @@ def render_graph(season, strength):
         plot_df['goals'] = plot_df['shortHandedGoals']
         plot_df['assists'] = plot_df['shortHandedAssists']
         plot_df['points'] = plot_df['shortHandedPoints']
-    
     #Filter columns to be used, rename columns
     plot_df = plot_df[plot_df['gamesPlayed'] > 15]
-    plot_df = plot_df.rename(columns={'primaryPosition': 'Position',
-                            'gamesPlayed': 'GP',
-                            'goals': 'G',
-                            'assists': 'A',
-                            'points': 'P',
-                            'salary': 'Cap Hit'})
-    #Aggregate columns
-    goals_df = plot_df.groupby('G')['Cap Hit'].mean().reset_index()
-    assists_df = plot_df.groupby('A')['Cap Hit'].mean().reset_index()
-    points_df = plot_df.groupby('P')['Cap Hit'].mean().reset_index()
+    return plot_df.rename(columns=column_labels)
+
+#Rows and mean cap hit by goals, assists and points for the graph view at a season and strength
+def graph_data(season, strength):
+    stats_db = get_dataset().stats_db
+    if stats_db is not None:
+        with nhl_metrics.phase('pandas'):
+            plot_df = stats_db.graph_rows(season, strength, 15).rename(columns=column_labels)
+            return (plot_df,) + tuple(stats_db.cap_hit_means(season, strength, stat, 15).rename(columns=column_labels)
+                                      for stat in ('goals', 'assists', 'points'))
+    plot_df = strength_frame(strength)
+    with nhl_metrics.phase('pandas'):
+        #Filter based on selections
+        if season != 'All':
+            plot_df = plot_df[plot_df['Season'] == season]
+        #Aggregate columns
+        goals_df = plot_df.groupby('G')['Cap Hit'].mean().reset_index()
+        assists_df = plot_df.groupby('A')['Cap Hit'].mean().reset_index()
+        points_df = plot_df.groupby('P')['Cap Hit'].mean().reset_index()
+    return plot_df, goals_df, assists_df, points_df
+
+#Builds the graph view figures for a season and strength. Returns the figures serialized to JSON
+def build_graph_figures(season, strength):
+    plot_df, goals_df, assists_df, points_df = graph_data(season, strength)
+    report_progress(1, 4)
     
-    #Create plots to be placed in subplot
-    goals_pie = px.pie(plot_df, values='G', names='Position', hole=0.25)
-    assists_pie = px.pie(plot_df, values='A', names='Position', hole=0.25)
-    points_pie = px.pie(plot_df, values='P', names='Position', hole=0.25)
-    salary_pie = px.pie(plot_df, values='Cap Hit', names='Position', hole=0.25)
-    position_pie = px.histogram(plot_df, x='Position')
-    #Create subplots
-    pie_fig = sp.make_subplots(rows=1, cols=5,
-                               subplot_titles=('Goals', 'Assists', 'Points', 'Cap Hit', 'Position'),
-                               specs=[[{'type':'domain'}, {'type':'domain'}, {'type':'domain'}, {'type':'domain'}, {'type':'xy'}]])
-    #Add traces to subplot
-    for trace in range(len(goals_pie['data'])):
-        pie_fig.append_trace(goals_pie['data'][trace], row=1,col=1)
-    for trace in range(len(assists_pie['data'])):
-        pie_fig.append_trace(assists_pie['data'][trace], row=1,col=2)
-    for trace in range(len(points_pie['data'])):
-        pie_fig.append_trace(points_pie['data'][trace], row=1,col=3)
-    for trace in range(len(salary_pie['data'])):
-        pie_fig.append_trace(salary_pie['data'][trace], row=1,col=4)
-    for trace in range(len(position_pie['data'])):
-        pie_fig.append_trace(position_pie['data'][trace], row=1,col=5)
+    with nhl_metrics.phase('figure'):
+        #plotly.express is slow to import and only needed here
+        import plotly.express as px
+        import plotly.subplots as sp
+        #Create plots to be placed in subplot
+        goals_pie = px.pie(plot_df, values='G', names='Position', hole=0.25)
+        assists_pie = px.pie(plot_df, values='A', names='Position', hole=0.25)
+        points_pie = px.pie(plot_df, values='P', names='Position', hole=0.25)
+        salary_pie = px.pie(plot_df, values='Cap Hit', names='Position', hole=0.25)
+        position_pie = px.histogram(plot_df, x='Position')
+        #Create subplots
+        pie_fig = sp.make_subplots(rows=1, cols=5,
+                                   subplot_titles=('Goals', 'Assists', 'Points', 'Cap Hit', 'Position'),
+                                   specs=[[{'type':'domain'}, {'type':'domain'}, {'type':'domain'}, {'type':'domain'}, {'type':'xy'}]])
+        #Add traces to subplot
+        for trace in range(len(goals_pie['data'])):
+            pie_fig.append_trace(goals_pie['data'][trace], row=1,col=1)
+        for trace in range(len(assists_pie['data'])):
+            pie_fig.append_trace(assists_pie['data'][trace], row=1,col=2)
+        for trace in range(len(points_pie['data'])):
+            pie_fig.append_trace(points_pie['data'][trace], row=1,col=3)
+        for trace in range(len(salary_pie['data'])):
+            pie_fig.append_trace(salary_pie['data'][trace], row=1,col=4)
+        for trace in range(len(position_pie['data'])):
+            pie_fig.append_trace(position_pie['data'][trace], row=1,col=5)
     
-    #Create plots to be placed in subplot
-    goals_scatter = px.scatter(goals_df, x='G', y='Cap Hit')
-    assists_scatter = px.scatter(assists_df, x='A', y='Cap Hit')
-    points_scatter = px.scatter(points_df, x='P', y='Cap Hit')
-    #Create subplots
-    scatter_fig = sp.make_subplots(rows=1, cols=3, subplot_titles=('Goals', 'Assists', 'Points'))
-    #Add traces to subplot
-    for trace in range(len(goals_scatter['data'])):
-        scatter_fig.append_trace(goals_scatter['data'][trace], row=1, col=1)
-    for trace in range(len(assists_scatter['data'])):
-        scatter_fig.append_trace(assists_scatter['data'][trace], row=1, col=2)
-    for trace in range(len(points_scatter['data'])):
-        scatter_fig.append_trace(points_scatter['data'][trace], row=1, col=3)
+        report_progress(2, 4)
+        #Create plots to be placed in subplot
+        goals_scatter = px.scatter(goals_df, x='G', y='Cap Hit')
+        assists_scatter = px.scatter(assists_df, x='A', y='Cap Hit')
+        points_scatter = px.scatter(points_df, x='P', y='Cap Hit')
+        #Create subplots
+        scatter_fig = sp.make_subplots(rows=1, cols=3, subplot_titles=('Goals', 'Assists', 'Points'))
+        #Add traces to subplot
+        for trace in range(len(goals_scatter['data'])):
+            scatter_fig.append_trace(goals_scatter['data'][trace], row=1, col=1)
+        for trace in range(len(assists_scatter['data'])):
+            scatter_fig.append_trace(assists_scatter['data'][trace], row=1, col=2)
+        for trace in range(len(points_scatter['data'])):
+            scatter_fig.append_trace(points_scatter['data'][trace], row=1, col=3)
     
-    return html.Div([
-        html.H3('Positional Breakdown'),
-        dcc.Graph(
-            id='plot-1',
-            figure=pie_fig
-        ),
-        html.Br(),
-        html.H3('Goals vs Cap Hit'),
-        html.Div([
-            html.Div([
-                dcc.Graph(
-                id='plot-2',
-                figure=px.violin(plot_df, x='Position', y='Cap Hit')
-                )
-            ], className = 'six columns'),
-            html.Div([
-                dcc.Graph(
-                id='plot-3',
-                figure=px.strip(plot_df, x='Position', y='Cap Hit')
-                )
-            ], className = 'six columns')
-        ], className='row'),
-        dcc.Graph(
-            id='plot-4',
-            figure=scatter_fig
-        ),
-    ])
+    report_progress(3, 4)
+    with nhl_metrics.phase('figure'):
+        figures = {
+            'plot-1': pie_fig,
+            'plot-2': px.violin(plot_df, x='Position', y='Cap Hit'),
+            'plot-3': px.strip(plot_df, x='Position', y='Cap Hit'),
+            'plot-4': scatter_fig
+        }
+    with nhl_metrics.phase('serialize'):
+        return to_json_plotly(figures)
+
+#Graph view figures keyed by (season, strength). The input space is small and finite, so every combination is kept.
+#Set NHL_FIGURE_CACHE_DIR to also persist the figures on disk, where other worker processes and restarts reuse them
+graph_cache = {}
+graph_lock = threading.Lock()
+figure_cache_dir = os.environ.get('NHL_FIGURE_CACHE_DIR')
+
+#Figures are built outside the lock. Like keyed_cache, figures that finish after a reload are served but not kept
+def graph_figures(season, strength):
+    key = (season, strength)
+    figures = graph_cache.get(key)
+    nhl_metrics.record_cache('graph_figures', figures is not None)
+    if figures is None:
+        current = get_dataset()
+        figures = json.loads(graph_figures_json(season, strength, current))
+        with graph_lock:
+            if get_dataset().generation == current.generation:
+                graph_cache[key] = figures
+    return figures
+
+#Reads the serialized figures of a dataset from the disk cache, building them on a miss. Built figures are only
+#written if that dataset is still current when they are done, so the file of a version holds figures of its rows
+def graph_figures_json(season, strength, current):
+    if not figure_cache_dir:
+        return build_graph_figures(season, strength)
+    #The data version in the file name keeps figures of an older dataset from being served
+    path = os.path.join(figure_cache_dir, 'graph-' + current.version + '-' + season + '-' + strength + '.json')
+    try:
+        with open(path) as f:
+            figures = f.read()
+        nhl_metrics.record_cache('graph_figures_disk', True)
+        return figures
+    except OSError:
+        nhl_metrics.record_cache('graph_figures_disk', False)
+    figures = build_graph_figures(season, strength)
+    if get_dataset().generation != current.generation:
+        return figures
+    os.makedirs(figure_cache_dir, exist_ok=True)
+    tmp_path = path + '.tmp' + str(os.getpid())
+    with open(tmp_path, 'w') as f:
+        f.write(figures)
+    os.replace(tmp_path, path)
+    return figures
+
+#Callback for graph view. Takes strength and season as input. Outputs multiple graph objects
+@nhl_metrics.instrument
+def render_graph(season, strength):
+    get_data()
+    if (season, strength) not in graph_keys:
+        return no_update
+    figures = graph_figures(season, strength)
+    return graph_view(figures)
+
+#Compact columnar snapshot of the graph view rows for the browser. Seasons and positions are sent as codes into a
+#list of names, and the plotly template is sent once instead of with every figure. The version of the data it was
+#taken from tells the browser's copy apart from a reloaded one
+@keyed_cache(maxsize=None)
+@nhl_metrics.timed('pandas')
+def graph_snapshot():
+    current = get_dataset()
+    data = current.data
+    plot_df = data[data['gamesPlayed'] > 15]
+    snapshot = {'version': current.version,
+                'seasons': [str(season) for season in plot_df['season'].cat.categories],
+                'season': plot_df['season'].cat.codes.tolist(),
+                'positions': [str(position) for position in plot_df['primaryPosition'].cat.categories],
+                'position': plot_df['primaryPosition'].cat.codes.tolist(),
+                'template': json.loads(to_json_plotly(pio.templates['plotly']))}
+    for column in ['salary', 'goals', 'assists', 'points', 'powerPlayGoals', 'powerPlayAssists', 'powerPlayPoints',
+                   'shortHandedGoals', 'shortHandedAssists', 'shortHandedPoints']:
+        snapshot[column] = plot_df[column].tolist()
+    return snapshot
+
+if clientside_graphs:
+    #Callback for sending the graph view snapshot. Takes active tab and the refresh interval as input. Outputs the
+    #snapshot and its version when the graph view is open and the browser's copy is missing or from older data. Only
+    #the version is sent back, not the snapshot
+    @app.callback(
+        Output('graph-snapshot', 'data'),
+        Output('graph-snapshot-version', 'data'),
+        Input('tabs-example-graph', 'value'),
+        Input('season-refresh', 'n_intervals'),
+        State('graph-snapshot-version', 'data'))
+    @nhl_metrics.instrument
+    def load_graph_snapshot(tab, n_intervals, version):
+        if tab != 'Graph View' or version == get_dataset().version:
+            return no_update, no_update
+        snapshot = graph_snapshot()
+        return snapshot, snapshot['version']
+
+    #Clientside callback for graph view. Takes season, strength and the snapshot as input. Outputs the four figures
+    app.clientside_callback(
+        ClientsideFunction(namespace='nhl', function_name='graphView'),
+        Output('plot-1', 'figure'),
+        Output('plot-2', 'figure'),
+        Output('plot-3', 'figure'),
+        Output('plot-4', 'figure'),
+        Input('season-select-2', 'value'),
+        Input('strength-select-2', 'value'),
+        Input('graph-snapshot', 'data')
+    )
+else:
+    slow_callback('graph',
+        Output('graph-output-wrapper', 'children'),
+        Input('season-select-2', 'value'),
+        Input('strength-select-2', 'value'))(render_graph)
 
 #Clientside callback for changing document title based on tab selected. Takes active tab value as input. Outputs document title
 app.clientside_callback(
@@ -421,7 +1359,159 @@ app.clientside_callback(
     Input('tabs-example-graph', 'value')
 )
 
-#Run with debug mode active on port 3000
+#Caches derived from the dataset
+lru_caches = [player_profile, season_table, stat_summary, strength_frame, graph_snapshot]
+for cached in lru_caches:
+    nhl_metrics.register_lru_cache(cached.__name__, cached)
+
+#Drops every cached table, summary and figure so the next request recomputes it from the current dataset
+def clear_caches():
+    for cached in lru_caches:
+        cached.cache_clear()
+    with graph_lock:
+        graph_cache.clear()
+
+#Swaps in a different dataset, e.g. a synthetic one in nhl_bench.py. Rebuilds the name index and season lists the
+#callbacks read and clears the caches. The layout built at import keeps its original dropdown options. With the SQL
+#backend, database is a nhl_sql.StatsDatabase holding the same rows. The rows no longer match the CSV lines, so a
+#later reload parses the whole file
+def set_data(frame, version, database=None):
+    current = get_dataset()
+    swap_dataset(frame, PlayerNameIndex(frame), None, current.signature, version,
+                 database if database is not None else current.stats_db)
+    clear_caches()
+
+reload_lock = threading.Lock()
+
+#Merges rows appended to or changed in combinedstats.csv into the dataset without parsing the rest of the file. Rows
+#are matched to the CSV lines they came from by hash: new lines are parsed and replace the row of the same player and
+#season whose line is gone, or are appended. Rows whose line is gone and that were not replaced are dropped. The
+#merged rows, name index and database are built next to the current ones and swapped in together, then only the
+#caches of the affected seasons and players are invalidated. Returns the affected seasons, or None if the file did
+#not change
+def reload_data():
+    #Nothing to merge into yet, the first load reads the current CSV
+    if dataset is None:
+        return None
+    with reload_lock:
+        current = dataset
+        #A stat tells an unchanged file apart, its lines are only read when it changed
+        if nhl_store.source_signature(csv_path) == current.signature:
+            return None
+        signature, header, lines = nhl_store.read_lines(csv_path)
+        if signature == current.signature:
+            return None
+        hashes = nhl_store.hash_lines(lines)
+        data, row_hashes = current.data, current.row_hashes
+        if row_hashes is None:
+            #Nothing to match the lines to, parse the whole file once
+            nhl_store.ingest(csv_path, store_path)
+            frame = nhl_store.read_store(store_path)
+            database = nhl_sql.connect(csv_path) if current.stats_db is not None else None
+            swap_dataset(frame, PlayerNameIndex(frame), nhl_store.read_line_hashes(store_path), signature,
+                         dataset_version(signature), database)
+            clear_caches()
+            return set(season_options)
+        fresh = np.flatnonzero(~np.isin(hashes, row_hashes))
+        gone = np.flatnonzero(~np.isin(row_hashes, np.asarray(hashes)))
+        changes = nhl_store.parse_lines(header, [lines[i] for i in fresh]) if len(fresh) else data.iloc[:0]
+        #Match each new line to the gone row of the same player and season. The last of repeated lines wins
+        gone_keys = pd.MultiIndex.from_arrays([data['player_id'].to_numpy()[gone], data['season'].to_numpy()[gone].astype(str)])
+        new_keys = pd.MultiIndex.from_arrays([changes['player_id'].to_numpy(), changes['season'].to_numpy().astype(str)])
+        latest = ~new_keys.duplicated(keep='last')
+        fresh, changes, new_keys = fresh[latest], changes[latest].reset_index(drop=True), new_keys[latest]
+        match = gone_keys.get_indexer(new_keys) if gone_keys.is_unique else np.full(len(new_keys), -1)
+        replaced = match >= 0
+        #Position in data of the row each parsed line replaces, -1 for appended lines
+        at = np.full(len(changes), -1)
+        at[replaced] = gone[match[replaced]]
+        #Row order of the merged frame, as positions in data followed by the parsed lines
+        n = len(data)
+        order = np.arange(n)
+        order[at[replaced]] = n + np.flatnonzero(replaced)
+        dropped = np.setdiff1d(gone, at[replaced])
+        order = np.concatenate([np.delete(order, dropped), n + np.flatnonzero(~replaced)])
+        combined = nhl_store.concat([data, changes])
+        merged = combined.iloc[order].reset_index(drop=True)
+        merged_hashes = np.concatenate([row_hashes, hashes[fresh]])[order]
+        touched = np.concatenate([gone, n + np.arange(len(changes))])
+        players = set(combined['player_id'].to_numpy()[touched].tolist())
+        affected = set(combined['season'].to_numpy()[touched].astype(str).tolist())
+        #Dropping rows moves the rows after them, so the name index is rebuilt. Otherwise only positions of the
+        #affected players change
+        index = PlayerNameIndex(merged) if len(dropped) else current.player_index.updated(merged, players)
+        database = None
+        if current.stats_db is not None:
+            database = nhl_sql.update(current.stats_db.db_path, current.signature, signature, gone, changes, at, merged)
+        swap_dataset(merged, index, merged_hashes, signature, dataset_version(signature), database)
+        for player_id in players:
+            player_profile.cache_forget(player_id)
+        for season in affected:
+            season_table.cache_forget(season)
+        #Summaries and graph view frames span every season
+        for cached in (stat_summary, strength_frame, graph_snapshot):
+            cached.cache_clear()
+        with graph_lock:
+            for key in list(graph_cache):
+                if key[0] in affected or key[0] == 'All':
+                    graph_cache.pop(key, None)
+        #Save the merged rows so the next start does not parse the CSV. Other workers may have saved them already
+        meta = nhl_store.read_meta(store_path)
+        if meta is None or meta['source'] != signature:
+            nhl_store.write_store(merged, store_path, signature, merged_hashes)
+        return affected
+
+#Polls combinedstats.csv for changes in a daemon thread and re-warms the invalidated caches after a reload. Threads do
+#not survive a fork, so under gunicorn each worker starts its own after forking (see gunicorn.conf.py)
+reloader = None
+def start_reloader():
+    global reloader
+    if reload_seconds is None or reloader is not None:
+        return
+    def watch():
+        while True:
+            time.sleep(reload_seconds)
+            try:
+                if reload_data() is not None:
+                    warm_caches()
+            except Exception:
+                app.logger.exception('Reloading ' + csv_path + ' failed')
+    reloader = threading.Thread(target=watch, name='nhl-reload', daemon=True)
+    reloader.start()
+
+if reload_seconds is not None:
+    #Callbacks for season dropdowns. Take the refresh interval as input. Output the season options when seasons were
+    #added or removed since the dropdown was built. One callback per dropdown, they sit in different tabs
+    def refresh_season_options(dropdown, current):
+        @app.callback(
+            Output(dropdown, 'options'),
+            Input('season-refresh', 'n_intervals'),
+            State(dropdown, 'options'))
+        def refresh(n_intervals, options):
+            if options == current:
+                return no_update
+            return list(current)
+    refresh_season_options('season-select-1', season_options)
+    refresh_season_options('season-select-2', seasons)
+
+#Materializes the per-season tables, stat summaries and graph view figures ahead of time so the first request for each season is as fast as the rest
+def warm_caches():
+    get_data()
+    for season in season_options:
+        season_table(season)
+    for stat in stats_columns:
+        stat_summary(stat)
+    if clientside_graphs:
+        graph_snapshot()
+        return
+    for season in seasons:
+        for strength_value in strength:
+            graph_figures(season, strength_value)
+
+#Run with debug mode active on port 3000. For concurrent load serve wsgi.py with gunicorn, see README.md
 if __name__ == '__main__':
+    if not lazy_start:
+        warm_caches()
+    start_reloader()
     app.run_server(debug=True, port=3000)
     #app.run_server(debug=False, port=3000)
\ No newline at end of file
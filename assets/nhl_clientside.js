@@ -0,0 +1,104 @@
+// Clientside callbacks for the NHL dashboard, served automatically by Dash from the assets folder.
+// The graph view is filtered and aggregated here from a columnar snapshot of the data sent once by the server,
+// so changing season or strength does not make a server round-trip.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    nhl: {
+        graphView: function(season, strength, snapshot) {
+            if (!snapshot) {
+                return [window.dash_clientside.no_update, window.dash_clientside.no_update,
+                        window.dash_clientside.no_update, window.dash_clientside.no_update];
+            }
+            var seasonCode = season === 'All' ? -1 : snapshot.seasons.indexOf(season);
+            //A season the snapshot does not have, e.g. picked before a reloaded snapshot arrives, has no rows
+            if (seasonCode === -1 && season !== 'All') {
+                var empty = {data: [], layout: {template: snapshot.template}};
+                return [empty, empty, empty, empty];
+            }
+            //Goals, assists and points at the selected strength
+            var derive = function(total, powerPlay, shortHanded) {
+                if (strength === 'EV') {
+                    return function(i) { return snapshot[total][i] - snapshot[powerPlay][i] - snapshot[shortHanded][i]; };
+                } else if (strength === 'PP') {
+                    return function(i) { return snapshot[powerPlay][i]; };
+                } else if (strength === 'SH') {
+                    return function(i) { return snapshot[shortHanded][i]; };
+                }
+                return function(i) { return snapshot[total][i]; };
+            };
+            var stats = {
+                'G': derive('goals', 'powerPlayGoals', 'shortHandedGoals'),
+                'A': derive('assists', 'powerPlayAssists', 'shortHandedAssists'),
+                'P': derive('points', 'powerPlayPoints', 'shortHandedPoints'),
+                'Cap Hit': function(i) { return snapshot.salary[i]; }
+            };
+            var names = ['G', 'A', 'P', 'Cap Hit'];
+            var positions = snapshot.positions;
+            //One pass over the season's rows: per position sums and counts, mean cap hit per stat value
+            var sums = {}, counts = positions.map(function() { return 0; });
+            var byValue = {'G': {}, 'A': {}, 'P': {}};
+            var rowPositions = [], rowSalaries = [];
+            names.forEach(function(name) { sums[name] = positions.map(function() { return 0; }); });
+            for (var i = 0; i < snapshot.season.length; i++) {
+                if (seasonCode >= 0 && snapshot.season[i] !== seasonCode) {
+                    continue;
+                }
+                var position = snapshot.position[i];
+                var salary = snapshot.salary[i];
+                counts[position] += 1;
+                rowPositions.push(positions[position]);
+                rowSalaries.push(salary);
+                names.forEach(function(name) {
+                    var value = stats[name](i);
+                    sums[name][position] += value;
+                    if (byValue[name]) {
+                        var group = byValue[name][value] || (byValue[name][value] = [0, 0]);
+                        group[0] += salary;
+                        group[1] += 1;
+                    }
+                });
+            }
+            var template = snapshot.template;
+            var title = function(text, x) {
+                return {text: text, x: x, y: 1.0, xref: 'paper', yref: 'paper', xanchor: 'center', yanchor: 'bottom',
+                        showarrow: false, font: {size: 16}};
+            };
+            //Positional breakdown, laid out like make_subplots(rows=1, cols=5)
+            var pieTraces = [], pieTitles = [], subplotTitles = ['Goals', 'Assists', 'Points', 'Cap Hit', 'Position'];
+            names.forEach(function(name, col) {
+                var start = col * 0.208;
+                pieTraces.push({type: 'pie', labels: positions, values: sums[name], hole: 0.25, name: '',
+                                domain: {x: [start, start + 0.168], y: [0, 1]},
+                                hovertemplate: 'Position=%{label}<br>' + name + '=%{value}<extra></extra>'});
+            });
+            pieTraces.push({type: 'bar', x: positions, y: counts, xaxis: 'x', yaxis: 'y', showlegend: false, name: '',
+                            marker: {color: '#636efa'}, hovertemplate: 'Position=%{x}<br>count=%{y}<extra></extra>'});
+            subplotTitles.forEach(function(text, col) { pieTitles.push(title(text, col * 0.208 + 0.084)); });
+            var pieFig = {data: pieTraces, layout: {template: template, annotations: pieTitles,
+                          xaxis: {anchor: 'y', domain: [0.832, 1.0]}, yaxis: {anchor: 'x', domain: [0, 1]}}};
+            //Violin and strip plots of cap hit by position
+            var axes = {xaxis: {title: {text: 'Position'}}, yaxis: {title: {text: 'Cap Hit'}}, margin: {t: 60}};
+            var violinFig = {data: [{type: 'violin', x: rowPositions, y: rowSalaries, name: '', showlegend: false,
+                                     marker: {color: '#636efa'}, box: {visible: false}}],
+                             layout: Object.assign({template: template}, axes)};
+            var stripFig = {data: [{type: 'box', x: rowPositions, y: rowSalaries, name: '', showlegend: false,
+                                    boxpoints: 'all', pointpos: 0, hoveron: 'points', marker: {color: '#636efa'},
+                                    fillcolor: 'rgba(255,255,255,0)', line: {color: 'rgba(255,255,255,0)'}}],
+                            layout: Object.assign({template: template}, axes)};
+            //Mean cap hit per goals, assists and points value, laid out like make_subplots(rows=1, cols=3)
+            var scatterTraces = [], scatterLayout = {template: template, annotations: []};
+            ['G', 'A', 'P'].forEach(function(name, col) {
+                var values = Object.keys(byValue[name]).map(Number).sort(function(a, b) { return a - b; });
+                var suffix = col === 0 ? '' : String(col + 1);
+                var start = col * 0.3556;
+                scatterTraces.push({type: 'scatter', mode: 'markers', name: '', showlegend: false,
+                                    x: values, y: values.map(function(v) { return byValue[name][v][0] / byValue[name][v][1]; }),
+                                    xaxis: 'x' + suffix, yaxis: 'y' + suffix, marker: {color: '#636efa'},
+                                    hovertemplate: name + '=%{x}<br>Cap Hit=%{y}<extra></extra>'});
+                scatterLayout['xaxis' + suffix] = {anchor: 'y' + suffix, domain: [start, start + 0.2889]};
+                scatterLayout['yaxis' + suffix] = {anchor: 'x' + suffix, domain: [0, 1]};
+                scatterLayout.annotations.push(title(['Goals', 'Assists', 'Points'][col], start + 0.1444));
+            });
+            return [pieFig, violinFig, stripFig, {data: scatterTraces, layout: scatterLayout}];
+        }
+    }
+});
@@ -0,0 +1,18 @@
+# Gunicorn settings for the dashboard, see wsgi.py
+#   gunicorn -c gunicorn.conf.py wsgi:server
+import multiprocessing
+import os
+
+bind = os.environ.get('NHL_BIND', '0.0.0.0:3000')
+#Load the app in the master before forking so the dataset, indexes and warm caches are shared by all workers
+preload_app = True
+workers = int(os.environ.get('NHL_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+#Threads let one worker overlap several requests, the callbacks release the GIL in pandas and numpy
+worker_class = 'gthread'
+threads = int(os.environ.get('NHL_THREADS', 4))
+timeout = 120
+
+#Start the combinedstats.csv watcher in each worker, a thread started in the master would not survive the fork
+def post_fork(server, worker):
+    import NHLDashboard
+    NHLDashboard.start_reloader()
@@ -0,0 +1,242 @@
+# Headless benchmarks for the dashboard callbacks
+#Calls each callback function directly, without a browser or a server, against the real dataset and against
+#synthetic datasets scaled up from it. Reports cold and warm latency, peak memory and response size per callback and
+#dataset size, and writes the results to JSON so two runs can be compared
+#Run: python nhl_bench.py [--scales 1,10,100,1000] [--repeat 5] [--only render_graph] [--output results.json]
+#Compare: python nhl_bench.py --compare base.json new.json [--threshold 1.2]
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from plotly.io.json import to_json_plotly
+import nhl_store
+import NHLDashboard as dashboard
+
+csv_path = 'combinedstats.csv'
+#Synthetic stores are cached here and rebuilt when the CSV changes
+bench_data_dir = 'bench-data'
+bench_results_dir = 'bench-results'
+#Each synthetic copy of the dataset is a new set of players, moved back in time by a decade per copy so history
+#grows to this many decades, e.g. 10x covers 1920-21 to 2019-20. Larger scales add players to those seasons
+history_decades = 10
+#Offset between the player_ids of two copies, larger than any real player_id
+player_id_stride = 10 ** 7
+#Timing changes smaller than this are noise and never flagged in --compare
+noise_floor_ms = 1.0
+
+#Shifts the years in a season ('2015-16') or a date ('1987-08-07') back by a number of years
+def shift_years(value, years):
+    if not years:
+        return value
+    if len(value) == 7 and value[4] == '-':
+        start = int(value[:4]) - years
+        return str(start) + '-' + str(start + 1)[2:]
+    return str(int(value[:4]) - years) + value[4:]
+
+#Returns the category label for a copy of the dataset. Copies after the first are different players with their own
+#last names, seasons and birth dates
+def copy_label(column, value, copy):
+    years = 10 * (copy % history_decades)
+    if column in ('season', 'birthDate'):
+        return shift_years(value, years)
+    if column == 'lastName' and copy:
+        return value + ' ' + str(copy)
+    return value
+
+#Builds a dataset with scale times the rows of frame and the same schema. Category columns are remapped through
+#their categories, so each copy costs one gather per column
+def synthesize(frame, scale):
+    columns = {}
+    for column in frame.columns:
+        values = frame[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories = {}
+            codes = []
+            for copy in range(scale):
+                labels = [copy_label(column, str(value), copy) for value in values.cat.categories]
+                remap = np.array([categories.setdefault(label, len(categories)) for label in labels], dtype=np.int32)
+                codes.append(remap[values.cat.codes.to_numpy()])
+            columns[column] = pd.Categorical.from_codes(np.concatenate(codes), categories=list(categories))
+        elif column == 'player_id':
+            ids = values.to_numpy().astype(np.int64)
+            columns[column] = np.concatenate([ids + copy * player_id_stride for copy in range(scale)])
+        else:
+            columns[column] = np.tile(values.to_numpy(), scale)
+    return pd.DataFrame(columns)
+
+#Returns the dataset at a scale, and its database when the dashboard runs on the SQL backend. Synthetic datasets are
+#written to a store under bench-data once and memory-mapped, the same way the dashboard loads the real one
+def load_scale(base, base_db, scale):
+    if scale == 1:
+        return base, base_db
+    store_path = os.path.join(bench_data_dir, 'scale-' + str(scale) + '.store')
+    signature = {'scale': scale, 'csv': nhl_store.source_signature(csv_path), 'version': nhl_store.store_version}
+    meta = nhl_store.read_meta(store_path)
+    if meta is None or meta['source'] != signature:
+        os.makedirs(bench_data_dir, exist_ok=True)
+        nhl_store.write_store(synthesize(base, scale), store_path, signature)
+    frame = nhl_store.read_store(store_path)
+    if base_db is None:
+        return frame, None
+    import nhl_sql
+    db_path = os.path.join(bench_data_dir, 'scale-' + str(scale) + '.duckdb')
+    if nhl_sql.read_signature(db_path) != signature:
+        nhl_sql.write_frame(frame, db_path, signature)
+    return frame, nhl_sql.StatsDatabase(db_path)
+
+#Benchmark cases as (callback, case, function of the dataset returning the call). Inputs come from the real data,
+#which is the first copy at every scale
+def benchmark_cases():
+    latest = lambda: max(dashboard.season_options)
+    sort_points = [{'column_id': 'P', 'direction': 'desc'}]
+    return [
+        ('render_stats', 'exact name', lambda: dashboard.render_stats('Sidney Crosby')),
+        ('render_stats', 'fuzzy name', lambda: dashboard.render_stats('sidny crosbi')),
+        ('render_comparison', '30 players', lambda: dashboard.render_comparison([int(player_id) for player_id in dashboard.get_player_index().ids[:30]], 'P')),
+        ('page_player_table', 'sorted page', lambda: dashboard.page_player_table(0, dashboard.table_page_size, sort_points, '', 'Sidney Crosby')),
+        ('render_radio', 'latest season', lambda: dashboard.render_radio(latest())),
+        ('page_league_table', 'sorted filtered page', lambda: dashboard.page_league_table(2, dashboard.table_page_size, sort_points, '{G} s>= 10 && {Position} s= C', latest())),
+        ('render_overview', 'full range', lambda: dashboard.render_overview('G', None, None)),
+        ('render_overview', 'min/max range', lambda: dashboard.render_overview('Cap Hit', 1000000, 5000000)),
+        ('render_graph', 'all seasons', lambda: dashboard.render_graph('All', 'All')),
+        ('render_graph', 'latest season EV', lambda: dashboard.render_graph(latest(), 'EV')),
+        ('graph_snapshot', 'clientside data', lambda: dashboard.graph_snapshot()),
+    ]
+
+def milliseconds(start):
+    return (time.perf_counter() - start) * 1000
+
+#Runs one case. Cold is the first call after the caches are cleared, warm is the median and p95 of repeated calls
+#with warm caches. Peak memory is measured in a separate cold call, since tracing allocations slows the call down
+def run_case(call, repeat):
+    dashboard.clear_caches()
+    gc.collect()
+    start = time.perf_counter()
+    result = call()
+    cold = milliseconds(start)
+    warm = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = call()
+        warm.append(milliseconds(start))
+    #Dash serializes callback results with the same encoder
+    start = time.perf_counter()
+    response = to_json_plotly(result)
+    serialize = milliseconds(start)
+    dashboard.clear_caches()
+    gc.collect()
+    tracemalloc.start()
+    call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    warm.sort()
+    return {'cold_ms': round(cold, 3),
+            'warm_ms': round(statistics.median(warm), 3) if warm else None,
+            'warm_p95_ms': round(warm[min(len(warm) - 1, int(0.95 * len(warm)))], 3) if warm else None,
+            'serialize_ms': round(serialize, 3),
+            'peak_bytes': peak,
+            'response_bytes': len(response.encode())}
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+#Runs every case at every scale and returns the results document
+def run(scales, repeat, only):
+    current = dashboard.get_dataset()
+    base, base_version, base_db = current.data, current.version, current.stats_db
+    results = []
+    for scale in scales:
+        start = time.perf_counter()
+        frame, database = load_scale(base, base_db, scale)
+        dashboard.set_data(frame, base_version if scale == 1 else base_version + '-x' + str(scale), database)
+        print('%dx: %d rows, %d players, %d seasons (loaded in %.1f s)' % (scale, len(frame), len(dashboard.get_player_index().ids),
+              len(dashboard.season_options), time.perf_counter() - start), file=sys.stderr)
+        for callback, case, call in benchmark_cases():
+            if only and callback not in only:
+                continue
+            result = {'callback': callback, 'case': case, 'scale': scale, 'rows': len(frame)}
+            result.update(run_case(call, repeat))
+            results.append(result)
+            print_row(result, sys.stderr)
+    dashboard.set_data(base, base_version, base_db)
+    return {'meta': {'commit': git_commit(),
+                     'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'backend': 'pandas' if base_db is None else 'duckdb',
+                     'python': platform.python_version(),
+                     'pandas': pd.__version__,
+                     'platform': platform.platform(),
+                     'repeat': repeat},
+            'results': results}
+
+def print_row(result, file=sys.stdout):
+    print('%-18s %-22s %5dx %12.1f %12.1f %12.1f %10.1f MB %10.1f KB' % (
+        result['callback'], result['case'], result['scale'], result['cold_ms'], result['warm_ms'] or 0,
+        result['warm_p95_ms'] or 0, result['peak_bytes'] / 2 ** 20, result['response_bytes'] / 2 ** 10), file=file)
+
+#Prints the ratio of every metric in a new run to the base run. Returns the rows that got slower or larger by more
+#than the threshold
+def compare(base, new, threshold):
+    metrics = ['cold_ms', 'warm_ms', 'peak_bytes', 'response_bytes']
+    base_rows = {(r['callback'], r['case'], r['scale']): r for r in base['results']}
+    print('base: %s %s   new: %s %s' % (base['meta']['commit'], base['meta']['time'], new['meta']['commit'], new['meta']['time']))
+    print('%-18s %-22s %6s ' % ('callback', 'case', 'scale') + ' '.join('%22s' % metric for metric in metrics))
+    regressions = []
+    for row in new['results']:
+        key = (row['callback'], row['case'], row['scale'])
+        if key not in base_rows:
+            continue
+        cells = []
+        for metric in metrics:
+            old_value, new_value = base_rows[key][metric], row[metric]
+            ratio = new_value / old_value if old_value else float('nan')
+            regressed = ratio > threshold and not (metric.endswith('_ms') and new_value - old_value < noise_floor_ms)
+            if regressed:
+                regressions.append((key, metric, ratio))
+            flag = '!' if regressed else ' '
+            cells.append('%12.6g %7.2fx%s' % (new_value, ratio, flag))
+        print('%-18s %-22s %5dx ' % key + ' '.join(cells))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the NHL dashboard callbacks')
+    parser.add_argument('--scales', default='1,10,100,1000', help='comma separated dataset sizes as multiples of the CSV')
+    parser.add_argument('--repeat', type=int, default=5, help='warm calls per case')
+    parser.add_argument('--only', default='', help='comma separated callbacks to run')
+    parser.add_argument('--output', help='results file, default bench-results/<commit>-<time>.json')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='compare two results files')
+    parser.add_argument('--threshold', type=float, default=1.2, help='ratio flagged as a regression in --compare')
+    args = parser.parse_args()
+    if args.compare:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        regressions = compare(base, new, args.threshold)
+        for key, metric, ratio in regressions:
+            print('regression: %s %s %dx %s %.2fx' % (key + (metric, ratio)))
+        sys.exit(1 if regressions else 0)
+    scales = [int(scale) for scale in args.scales.split(',')]
+    only = [callback for callback in args.only.split(',') if callback]
+    print('%-18s %-22s %6s %12s %12s %12s %13s %13s' % ('callback', 'case', 'scale', 'cold ms', 'warm ms', 'p95 ms',
+                                                        'peak mem', 'response'), file=sys.stderr)
+    document = run(scales, args.repeat, only)
+    output = args.output or os.path.join(bench_results_dir, document['meta']['commit'] + '-' +
+                                         time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(document, f, indent=1)
+    print('Wrote ' + output, file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
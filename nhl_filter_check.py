@@ -0,0 +1,81 @@
+# Filter check for the server side tables
+#Sends the filter queries the DataTable builds from what is typed into its filter row, with the 's' (case sensitive)
+#and 'i' (case insensitive) operator prefixes of its case toggle and ' && ' between columns, through the raw data
+#viewer's paging callback. The rows of every page are compared with the same filter applied with pandas to the
+#season's rows, and a filtered page past the last one must come back as the last page
+#Run: python nhl_filter_check.py [--season 2015-16]
+import argparse
+import sys
+import numpy as np
+
+import NHLDashboard as dashboard
+
+#Filter query as the DataTable sends it, and the same filter on the season's source columns as a boolean mask
+queries = [
+    ('{G} s> 20', lambda df: df['goals'] > 20),
+    ('{G} s>= 10 && {Position} s= C', lambda df: (df['goals'] >= 10) & (df['primaryPosition'] == 'C')),
+    ('{Position} s= c', lambda df: df['primaryPosition'] == 'c'),
+    ('{Position} i= c', lambda df: df['primaryPosition'].str.lower() == 'c'),
+    ('{Position} s!= C', lambda df: df['primaryPosition'] != 'C'),
+    ('{Name} scontains Kane', lambda df: df['firstName'].str.cat(df['lastName'], sep=' ').str.contains('Kane', regex=False)),
+    ('{Name} scontains kane', lambda df: df['firstName'].str.cat(df['lastName'], sep=' ').str.contains('kane', regex=False)),
+    ('{Name} icontains kane', lambda df: df['firstName'].str.cat(df['lastName'], sep=' ').str.lower().str.contains('kane', regex=False)),
+    ('{Name} scontains "Patrick Kane"', lambda df: df['firstName'].str.cat(df['lastName'], sep=' ') == 'Patrick Kane'),
+    ('{DoB} scontains 1987', lambda df: df['birthDate'].astype(str).str.contains('1987', regex=False)),
+    ('{DoB} datestartswith 1990-0', lambda df: df['birthDate'].astype(str).str.startswith('1990-0')),
+    ('{S%} s< 5', lambda df: df['shootingPercentage'] < 5),
+    ('{GP} s= 82', lambda df: df['gamesPlayed'] == 82),
+    ('{AToI} s> 20:00', lambda df: df['avgTimeOnIce'] > 1200),
+    ('{Cap Hit} s>= $10000000', lambda df: df['salary'] >= 10000000),
+    ('{+/-} s> +20', lambda df: df['plusMinus'] > 20),
+    ('{Cap Hit} scontains 000000', lambda df: df['salary'].astype(int).astype(str).str.contains('000000', regex=False)),
+]
+sort_points = [{'column_id': 'P', 'direction': 'desc'}]
+page_size = 25
+
+#The season's rows as the raw data viewer shows them, more than 10 games played
+def season_rows(season):
+    data = dashboard.get_data()
+    rows = data[(data['season'].astype(str) == season).to_numpy() & (data['gamesPlayed'] > 10).to_numpy()]
+    return rows.reset_index(drop=True)
+
+#Every page of one filter, in the order of the table sorted by points
+def all_pages(query, season):
+    records, page_count, page_current = dashboard.page_league_table(0, page_size, sort_points, query, season)
+    for page in range(1, page_count):
+        records = records + dashboard.page_league_table(page, page_size, sort_points, query, season)[0]
+    return records, page_count
+
+def check(query, expected_mask, season, rows, table):
+    problems = []
+    expected = np.sort(np.flatnonzero(np.asarray(expected_mask(rows), dtype=bool)))
+    records, page_count = all_pages(query, season)
+    if page_count != max(1, -(-len(expected) // page_size)):
+        problems.append('%d pages for %d rows' % (page_count, len(expected)))
+    positions = {id(record): i for i, record in enumerate(table.records)}
+    found = np.sort([positions[id(record)] for record in records])
+    if not np.array_equal(found, expected):
+        problems.append('%d rows, expected %d' % (len(found), len(expected)))
+    #A page past the last one shows the last page
+    last, _, page_current = dashboard.page_league_table(page_count + 5, page_size, sort_points, query, season)
+    if page_current != page_count - 1 or (len(expected) and not last):
+        problems.append('page %d past the last page shows page %d with %d rows' % (page_count + 5, page_current, len(last)))
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description='Check DataTable filter queries against the same filters in pandas')
+    parser.add_argument('--season', default='2015-16', help='season of the raw data viewer table')
+    args = parser.parse_args()
+    rows = season_rows(args.season)
+    table = dashboard.season_table(args.season)
+    failures = 0
+    for query, expected_mask in queries:
+        problems = check(query, expected_mask, args.season, rows, table)
+        print('%-40s %s' % (query, 'ok' if not problems else 'FAILED'))
+        for problem in problems:
+            print('  ' + problem)
+        failures += bool(problems)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
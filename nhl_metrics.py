@@ -0,0 +1,209 @@
+# Hot-path instrumentation for the dashboard callbacks
+#Records wall time, a pandas / figure / serialization breakdown, response bytes and cache hit rates per callback,
+#and serves them in the Prometheus text format on /metrics. Metrics are per process, under gunicorn every worker
+#keeps its own and a scrape reads the worker that answers it
+#Set NHL_PROFILE_SLOW_MS to dump a cProfile trace of every callback slower than that many milliseconds into
+#NHL_PROFILE_DIR. A request with the X-NHL-Profile: 1 header is always profiled and dumped
+import cProfile
+import copy
+import functools
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+import flask
+
+#Upper bounds in seconds of the latency histogram buckets
+latency_buckets = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+#Latencies kept per callback for the p50/p95/p99 quantiles
+reservoir_size = 1024
+phases = ['pandas', 'figure', 'serialize']
+
+profile_slow_ms = float(os.environ['NHL_PROFILE_SLOW_MS']) if os.environ.get('NHL_PROFILE_SLOW_MS') else None
+profile_dir = os.environ.get('NHL_PROFILE_DIR', 'profiles')
+
+#Running totals for one callback
+class CallbackStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(latency_buckets)
+        self.recent = deque(maxlen=reservoir_size)
+        self.phase_seconds = defaultdict(float)
+        self.responses = 0
+        self.response_bytes = 0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.recent.append(seconds)
+        for i, bound in enumerate(latency_buckets):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+    #Returns a copy to read outside the lock, callbacks keep updating this one
+    def snapshot(self):
+        stats = copy.copy(self)
+        stats.buckets = list(self.buckets)
+        stats.recent = deque(self.recent)
+        stats.phase_seconds = dict(self.phase_seconds)
+        return stats
+
+    def quantile(self, q):
+        recent = sorted(self.recent)
+        if not recent:
+            return float('nan')
+        return recent[min(len(recent) - 1, int(q * len(recent)))]
+
+lock = threading.Lock()
+callbacks = defaultdict(CallbackStats)
+#Hit and miss counts of caches that count for themselves, and functions returning (hits, misses) for the rest
+cache_counts = defaultdict(lambda: [0, 0])
+cache_sources = {}
+#Phase timers of the callback running on this thread
+local = threading.local()
+
+#Counts one lookup of a cache
+def record_cache(name, hit):
+    with lock:
+        cache_counts[name][0 if hit else 1] += 1
+
+#Reports a functools.lru_cache through its cache_info()
+def register_lru_cache(name, cached):
+    cache_sources[name] = lambda: (cached.cache_info().hits, cached.cache_info().misses)
+
+#Times a phase of the running callback, e.g. with phase('pandas'): ...
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timers = getattr(local, 'phases', None)
+        if timers is not None:
+            timers[name] += time.perf_counter() - start
+
+#Decorator form of phase for functions that belong to one phase
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _profiling_requested():
+    return flask.has_request_context() and flask.request.headers.get('X-NHL-Profile') == '1'
+
+def _dump_profile(profiler, name, seconds):
+    os.makedirs(profile_dir, exist_ok=True)
+    path = os.path.join(profile_dir, name + '-' + time.strftime('%Y%m%d-%H%M%S') + '-' + str(int(seconds * 1000)) + 'ms.prof')
+    profiler.dump_stats(path)
+
+#Wraps a callback to record its wall time and phase breakdown under its function name
+def instrument(func):
+    name = func.__name__
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        outer = getattr(local, 'phases', None)
+        local.phases = defaultdict(float)
+        forced = _profiling_requested()
+        profiler = cProfile.Profile() if forced or profile_slow_ms is not None else None
+        start = time.perf_counter()
+        try:
+            if profiler is None:
+                return func(*args, **kwargs)
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            timers, local.phases = local.phases, outer
+            with lock:
+                stats = callbacks[name]
+                stats.observe(seconds)
+                for phase_name, phase_seconds in timers.items():
+                    stats.phase_seconds[phase_name] += phase_seconds
+            if profiler is not None and (forced or seconds * 1000 >= profile_slow_ms):
+                _dump_profile(profiler, name, seconds)
+            #Let the request hooks attribute serialization time and payload size to this callback
+            if flask.has_request_context():
+                flask.g.nhl_callback = name
+                flask.g.nhl_callback_seconds = seconds
+    return wrapper
+
+def _before_request():
+    flask.g.nhl_request_start = time.perf_counter()
+
+def _after_request(response):
+    name = getattr(flask.g, 'nhl_callback', None)
+    if name is None or response.direct_passthrough:
+        return response
+    #Dash serializes the callback's return value after it returns, the rest of the request is that serialization
+    serialize = time.perf_counter() - flask.g.nhl_request_start - flask.g.nhl_callback_seconds
+    with lock:
+        stats = callbacks[name]
+        stats.phase_seconds['serialize'] += max(serialize, 0.0)
+        stats.responses += 1
+        stats.response_bytes += response.calculate_content_length() or 0
+    return response
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+#Renders every metric in the Prometheus text exposition format
+def render():
+    lines = []
+    with lock:
+        items = [(name, stats.snapshot()) for name, stats in sorted(callbacks.items())]
+        counts = {name: tuple(value) for name, value in cache_counts.items()}
+    lines += ['# HELP nhl_callback_duration_seconds Wall time of dashboard callbacks',
+              '# TYPE nhl_callback_duration_seconds histogram']
+    for name, stats in items:
+        for bound, count in zip(latency_buckets, stats.buckets):
+            lines.append('nhl_callback_duration_seconds_bucket{callback="%s",le="%g"} %d' % (_label(name), bound, count))
+        lines.append('nhl_callback_duration_seconds_bucket{callback="%s",le="+Inf"} %d' % (_label(name), stats.count))
+        lines.append('nhl_callback_duration_seconds_sum{callback="%s"} %.6f' % (_label(name), stats.seconds))
+        lines.append('nhl_callback_duration_seconds_count{callback="%s"} %d' % (_label(name), stats.count))
+    lines += ['# HELP nhl_callback_latency_seconds Latency quantiles over the most recent calls',
+              '# TYPE nhl_callback_latency_seconds summary']
+    for name, stats in items:
+        for q in (0.5, 0.95, 0.99):
+            lines.append('nhl_callback_latency_seconds{callback="%s",quantile="%g"} %.6f' % (_label(name), q, stats.quantile(q)))
+        lines.append('nhl_callback_latency_seconds_sum{callback="%s"} %.6f' % (_label(name), stats.seconds))
+        lines.append('nhl_callback_latency_seconds_count{callback="%s"} %d' % (_label(name), stats.count))
+    lines += ['# HELP nhl_callback_phase_seconds_total Time spent in pandas, figure building and serialization',
+              '# TYPE nhl_callback_phase_seconds_total counter']
+    for name, stats in items:
+        for phase_name in phases:
+            lines.append('nhl_callback_phase_seconds_total{callback="%s",phase="%s"} %.6f'
+                         % (_label(name), phase_name, stats.phase_seconds.get(phase_name, 0.0)))
+    lines += ['# HELP nhl_callback_response_bytes_total JSON bytes sent in callback responses',
+              '# TYPE nhl_callback_response_bytes_total counter']
+    for name, stats in items:
+        lines.append('nhl_callback_response_bytes_total{callback="%s"} %d' % (_label(name), stats.response_bytes))
+    lines += ['# HELP nhl_callback_responses_total Callback responses sent',
+              '# TYPE nhl_callback_responses_total counter']
+    for name, stats in items:
+        lines.append('nhl_callback_responses_total{callback="%s"} %d' % (_label(name), stats.responses))
+    for name, source in cache_sources.items():
+        counts[name] = source()
+    lines += ['# HELP nhl_cache_hits_total Cache lookups answered from the cache', '# TYPE nhl_cache_hits_total counter']
+    lines += ['nhl_cache_hits_total{cache="%s"} %d' % (_label(name), hits) for name, (hits, _) in sorted(counts.items())]
+    lines += ['# HELP nhl_cache_misses_total Cache lookups that had to compute', '# TYPE nhl_cache_misses_total counter']
+    lines += ['nhl_cache_misses_total{cache="%s"} %d' % (_label(name), misses) for name, (_, misses) in sorted(counts.items())]
+    lines += ['# HELP nhl_cache_hit_ratio Share of cache lookups that were hits', '# TYPE nhl_cache_hit_ratio gauge']
+    lines += ['nhl_cache_hit_ratio{cache="%s"} %.6f' % (_label(name), hits / (hits + misses) if hits + misses else 0.0)
+              for name, (hits, misses) in sorted(counts.items())]
+    return '\n'.join(lines) + '\n'
+
+#Adds the request hooks and the /metrics route to the Flask server. The route only answers local requests unless
+#NHL_METRICS_PUBLIC=1
+def install(server, path='/metrics'):
+    server.before_request(_before_request)
+    server.after_request(_after_request)
+    def metrics():
+        if os.environ.get('NHL_METRICS_PUBLIC') != '1' and flask.request.remote_addr not in ('127.0.0.1', '::1'):
+            flask.abort(404)
+        return flask.Response(render(), mimetype='text/plain; version=0.0.4')
+    server.add_url_rule(path, 'nhl_metrics', metrics)
@@ -0,0 +1,199 @@
+# Reload check for the dashboard
+#Copies combinedstats.csv to a temporary directory, loads the dashboard from the copy, then edits, appends and deletes
+#lines of the copy and merges each change in with reload_data(). After every reload the merged rows, the name index,
+#the cached season tables, player profiles and stat summaries, and the SQL backend's rows are compared with a fresh
+#parse of the edited file, and the caches of seasons and players the change did not touch must have been kept
+#Run: python nhl_reload_check.py [--keep]   (NHL_BACKEND=duckdb also checks the database)
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+#Nothing is loaded at import, so the dashboard can be pointed at the copy first
+os.environ['NHL_LAZY_START'] = '1'
+os.environ.pop('NHL_FIGURE_CACHE_DIR', None)
+import nhl_store
+import NHLDashboard as dashboard
+
+#CSV columns the edits change
+player_id_field, first_name_field, last_name_field, season_field, goals_field = 0, 1, 2, 6, 8
+#Searches compared between the merged and a freshly built name index
+queries = ['sidney crosby', 'crosby', 'sidny crosbi', 'mark recchi', 'marc recchy', 'recchy', 'zed zulu', 'zulu',
+           'sebastian aho', 'sebastian aho 1996']
+#Stat summaries kept warm between reloads
+summary_stats = ['G', 'P', 'Cap Hit', 'AToI']
+
+def find_line(lines, first_name, last_name, season):
+    for i, line in enumerate(lines):
+        fields = line.split(',')
+        if fields[first_name_field] == first_name and fields[last_name_field] == last_name and fields[season_field] == season:
+            return i
+    raise LookupError(first_name + ' ' + last_name + ' ' + season)
+
+def set_field(line, field, value):
+    fields = line.split(',')
+    fields[field] = value
+    return ','.join(fields)
+
+#Each change edits the lines of the CSV in place and returns the seasons it affects
+def edit_row(lines):
+    i = find_line(lines, 'Sidney', 'Crosby', '2015-16')
+    lines[i] = set_field(lines[i], goals_field, '99')
+    return {'2015-16'}
+
+def rename_player(lines):
+    seasons = set()
+    for i, line in enumerate(lines):
+        fields = line.split(',')
+        if fields[first_name_field] == 'Mark' and fields[last_name_field] == 'Recchi':
+            lines[i] = set_field(set_field(line, first_name_field, 'Marc'), last_name_field, 'Recchy')
+            seasons.add(fields[season_field])
+    return seasons
+
+def append_season(lines):
+    lines.append(set_field(lines[find_line(lines, 'Sidney', 'Crosby', '2019-20')], season_field, '2020-21'))
+    return {'2020-21'}
+
+def append_player(lines):
+    line = lines[find_line(lines, 'Sidney', 'Crosby', '2019-20')]
+    for field, value in ((player_id_field, '9999999'), (first_name_field, 'Zed'), (last_name_field, 'Zulu'),
+                         (season_field, '2020-21')):
+        line = set_field(line, field, value)
+    lines.append(line)
+    return {'2020-21'}
+
+def delete_rows(lines):
+    rows = [i for i, line in enumerate(lines) if line.split(',')[season_field] == '2010-11'][:3]
+    for i in reversed(rows):
+        del lines[i]
+    return {'2010-11'}
+
+def unchanged(lines):
+    return set()
+
+changes = [('edit a row', edit_row), ('rename a player', rename_player), ('append a season', append_season),
+           ('append a new player', append_player), ('delete rows', delete_rows), ('touch without changes', unchanged)]
+
+#Writes the lines and moves the modification time forward, edits within one clock tick would keep the signature
+def write_lines(path, lines, step):
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + step * 10 ** 9))
+
+#Category columns of merged and freshly parsed frames list their categories in different orders, compare the labels
+def as_text(frame):
+    categories = {column: str for column in frame.columns if isinstance(frame[column].dtype, pd.CategoricalDtype)}
+    return frame.astype(categories).reset_index(drop=True)
+
+def check_index(index, fresh):
+    problems = []
+    expected = dashboard.PlayerNameIndex(fresh)
+    if set(index.rows) != set(expected.rows):
+        problems.append('players differ: ' + str(sorted(set(index.rows) ^ set(expected.rows))[:5]))
+    problems += ['rows of player ' + str(player_id) + ' differ' for player_id, rows in expected.rows.items()
+                 if player_id in index.rows and not np.array_equal(index.rows[player_id], rows)]
+    for query in queries:
+        if index.lookup(query) != expected.lookup(query) or index.suggest(query) != expected.suggest(query):
+            problems.append('search ' + repr(query) + ': ' + str(index.suggest(query)) + ' != ' + str(expected.suggest(query)))
+    return problems
+
+def check_caches(fresh, before, affected):
+    problems = []
+    seasons = fresh['season'].astype(str)
+    for season in dashboard.season_options:
+        table = dashboard.season_table(season)
+        rows = fresh[(seasons == season).to_numpy() & (fresh['gamesPlayed'] > 10).to_numpy()]
+        if table.records != dashboard.materialize(rows, dashboard.league_view).records:
+            problems.append('season table ' + season + ' differs from a fresh build')
+        if season not in affected and table is not before['seasons'].get(season):
+            problems.append('season table ' + season + ' was rebuilt but is not affected')
+    players = fresh['player_id'].to_numpy()
+    for player_id, profile in before['players'].items():
+        rows = fresh[players == player_id]
+        if len(rows) == 0:
+            continue
+        if dashboard.player_profile(player_id)[1].records != dashboard.materialize(rows, dashboard.player_view).records:
+            problems.append('profile of player ' + str(player_id) + ' differs from a fresh build')
+        if player_id not in before['touched'] and dashboard.player_profile(player_id) is not profile:
+            problems.append('profile of player ' + str(player_id) + ' was rebuilt but is not affected')
+    for stat in summary_stats:
+        values, counts = np.unique(fresh[dashboard.label_columns[stat]].to_numpy(), return_counts=True)
+        if not dashboard.stat_summary(stat).stats.equals(dashboard.StatSummary(values, counts).stats):
+            problems.append('summary of ' + stat + ' differs from a fresh build')
+    return problems
+
+#The rows a season table is built from with the SQL backend, against the rows of the fresh parse
+def check_database(current, fresh):
+    if current.stats_db is None:
+        return []
+    problems = []
+    seasons = fresh['season'].astype(str)
+    for season in dashboard.season_options:
+        rows = fresh[(seasons == season).to_numpy() & (fresh['gamesPlayed'] > 10).to_numpy()]
+        queried = current.stats_db.season_rows(season, 10)
+        if not as_text(queried).astype(str).equals(as_text(rows).astype(str)):
+            problems.append('database rows of ' + season + ' differ from a fresh parse')
+    return problems
+
+#Warms the caches the check compares and remembers them, so rebuilt entries can be told from kept ones
+def warm(touched_players):
+    players = [int(player_id) for player_id in dashboard.get_player_index().ids[:20]] + sorted(touched_players)
+    for stat in summary_stats:
+        dashboard.stat_summary(stat)
+    return {'seasons': {season: dashboard.season_table(season) for season in dashboard.season_options},
+            'players': {player_id: dashboard.player_profile(player_id) for player_id in players}}
+
+def run(csv_path):
+    failures = 0
+    with open(csv_path) as f:
+        lines = f.read().splitlines()
+    dashboard.get_dataset()
+    for step, (name, change) in enumerate(changes, 1):
+        previous = list(lines)
+        expected = change(lines)
+        #Players on the lines that changed, their profiles are rebuilt
+        touched = {int(line.split(',')[player_id_field]) for line in set(previous[1:]) ^ set(lines[1:])}
+        before = warm(touched & set(dashboard.get_player_index().rows))
+        before['touched'] = touched
+        write_lines(csv_path, lines, step)
+        affected = dashboard.reload_data()
+        current = dashboard.get_dataset()
+        fresh = nhl_store.parse_lines(lines[0], lines[1:])
+        problems = []
+        if affected != expected:
+            problems.append('affected seasons ' + str(sorted(affected or [])) + ', expected ' + str(sorted(expected)))
+        if not as_text(current.data).astype(str).equals(as_text(fresh).astype(str)):
+            problems.append('merged rows differ from a fresh parse')
+        problems += check_index(current.player_index, fresh)
+        problems += check_caches(fresh, before, affected or set())
+        problems += check_database(current, fresh)
+        print('%-24s %s' % (name, 'ok' if not problems else 'FAILED'))
+        for problem in problems:
+            print('  ' + problem)
+        failures += bool(problems)
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description='Check incremental reloads of combinedstats.csv against fresh loads')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary copy of the CSV and its store')
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp(prefix='nhl-reload-')
+    csv_copy = os.path.join(workdir, os.path.basename(dashboard.csv_path))
+    shutil.copyfile(dashboard.csv_path, csv_copy)
+    dashboard.csv_path = csv_copy
+    dashboard.store_path = nhl_store.default_store_path(csv_copy)
+    try:
+        failures = run(csv_copy)
+    finally:
+        if args.keep:
+            print('Kept ' + workdir)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
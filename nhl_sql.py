@@ -0,0 +1,227 @@
+# Embedded SQL backend for combinedstats.csv
+#Loads the CSV into a local DuckDB database file (an in-process engine, no server) and answers the season tables,
+#stat summaries and graph view data with queries. Filters and aggregates run in the database and only their result
+#sets are materialized in pandas, so the rows do not have to fit in memory. Enable in the dashboard with
+#NHL_BACKEND=duckdb (pip install duckdb)
+#Run directly to (re)build the database: python nhl_sql.py [combinedstats.csv] [combinedstats.duckdb]
+import json
+import os
+import shutil
+import sys
+import threading
+from contextlib import contextmanager
+import duckdb
+import numpy as np
+import pandas as pd
+import nhl_store
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+#Column conversions from the CSV text to the typed columns of nhl_store.schema
+def column_expression(column, kind):
+    quoted = '"' + column + '"'
+    if kind == 'category':
+        return 'CAST(' + quoted + ' AS VARCHAR) AS ' + quoted
+    if kind == 'integer':
+        #Some integer columns are written as floats, e.g. 29876.0
+        return 'CAST(CAST(' + quoted + ' AS DOUBLE) AS BIGINT) AS ' + quoted
+    if kind == 'seconds':
+        return ('CAST(split_part(' + quoted + ", ':', 1) AS INTEGER) * 60 + CAST(split_part(" + quoted +
+                ", ':', 2) AS INTEGER) AS " + quoted)
+    return 'CAST(' + quoted + ' AS DOUBLE) AS ' + quoted
+
+select_list = ', '.join(column_expression(column, kind) for column, kind in nhl_store.schema.items())
+
+#Goals, assists and points for each strength, as in the graph view
+strength_expressions = {'All': ('goals', 'assists', 'points'),
+                        'EV': ('goals - powerPlayGoals - shortHandedGoals',
+                               'assists - powerPlayAssists - shortHandedAssists',
+                               'points - powerPlayPoints - shortHandedPoints'),
+                        'PP': ('powerPlayGoals', 'powerPlayAssists', 'powerPlayPoints'),
+                        'SH': ('shortHandedGoals', 'shortHandedAssists', 'shortHandedPoints')}
+
+#Creates the stats table from a query into a new database file, written next to the target and renamed into place
+#so readers never open a partially written database. row_id keeps the file order of the rows
+def write_database(db_path, signature, select, source, params=(), frame=None):
+    tmp_path = db_path + '.tmp' + str(os.getpid())
+    for path in (tmp_path, tmp_path + '.wal'):
+        if os.path.exists(path):
+            os.remove(path)
+    connection = duckdb.connect(tmp_path)
+    try:
+        if frame is not None:
+            connection.register('frame', frame)
+        connection.execute('CREATE TABLE stats AS SELECT row_number() OVER () AS row_id, ' + select + ' FROM ' + source,
+                           params)
+        connection.execute('CREATE TABLE meta AS SELECT ? AS source', [json.dumps(signature, sort_keys=True)])
+    finally:
+        connection.close()
+    os.replace(tmp_path, db_path)
+
+#Loads the CSV straight into the database. DuckDB streams the file, it is never read into pandas
+def ingest(csv_path, db_path):
+    write_database(db_path, nhl_store.source_signature(csv_path), select_list,
+                   'read_csv(?, all_varchar = true, header = true)', [csv_path])
+
+#Columns of a typed frame from nhl_store, with category columns as text
+frame_select = ', '.join('CAST("' + column + '" AS VARCHAR) AS "' + column + '"' if kind == 'category' else '"' + column + '"'
+                         for column, kind in nhl_store.schema.items())
+
+#Writes a typed frame from nhl_store to a database, e.g. a synthetic dataset in nhl_bench.py
+def write_frame(frame, db_path, signature):
+    write_database(db_path, signature, frame_select, 'frame', frame=frame)
+
+#Holds an exclusive lock on a file next to the database, so one process updates it while the others wait. Without
+#fcntl (Windows) there is only the development server's process
+@contextmanager
+def update_lock(db_path):
+    if fcntl is None:
+        yield
+        return
+    with open(db_path + '.lock', 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+#Applies a reload to a copy of the database, renamed into place when done. The rows at positions gone are deleted and
+#each row of changes is inserted at the position in at of the row it replaces, or after the last row for -1. Rows
+#keep their order by row_id, so a replacing row takes the row_id of the row it replaces
+def apply_changes(db_path, signature, gone, changes, at):
+    tmp_path = db_path + '.tmp' + str(os.getpid())
+    for path in (tmp_path, tmp_path + '.wal'):
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.copyfile(db_path, tmp_path)
+    connection = duckdb.connect(tmp_path)
+    try:
+        row_ids = connection.execute('SELECT row_id FROM stats ORDER BY row_id').fetchnumpy()['row_id']
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        at = np.asarray(at, dtype=np.int64)
+        appended = at < 0
+        ids = row_ids[np.where(appended, 0, at)] if len(row_ids) else np.zeros(len(at), dtype=np.int64)
+        start = int(row_ids[-1]) + 1 if len(row_ids) else 1
+        ids[appended] = np.arange(start, start + int(appended.sum()))
+        connection.register('gone', pd.DataFrame({'row_id': row_ids[np.asarray(gone, dtype=np.int64)]}))
+        connection.execute('DELETE FROM stats WHERE row_id IN (SELECT row_id FROM gone)')
+        connection.register('frame', changes.assign(row_id=ids))
+        connection.execute('INSERT INTO stats SELECT row_id, ' + frame_select + ' FROM frame')
+        connection.execute('UPDATE meta SET source = ?', [json.dumps(signature, sort_keys=True)])
+    finally:
+        connection.close()
+    os.replace(tmp_path, db_path)
+
+#Brings the database of the rows at old_signature up to date with a reload of the CSV, without reading the CSV (see
+#apply_changes). Under gunicorn every worker reloads at once: the first to take the lock updates the database and the
+#others find it current and only reopen it. A database at neither signature is rewritten from frame, the merged rows
+def update(db_path, old_signature, signature, gone, changes, at, frame):
+    with update_lock(db_path):
+        current = read_signature(db_path)
+        if current == old_signature:
+            apply_changes(db_path, signature, gone, changes, at)
+        elif current != signature:
+            write_frame(frame, db_path, signature)
+    return StatsDatabase(db_path)
+
+#Opens a database file read-only. duckdb.connect() shares one instance per path within a process, which keeps reading
+#the old file after it was replaced for as long as any connection to it is open. The file is attached to a private
+#in-memory instance instead, so every open reads the file currently at the path
+def open_read_only(db_path):
+    connection = duckdb.connect()
+    try:
+        connection.execute("ATTACH '" + db_path.replace("'", "''") + "' AS stats_file (READ_ONLY)")
+        connection.execute('USE stats_file')
+    except duckdb.Error:
+        connection.close()
+        raise
+    return connection
+
+#Returns the source signature a database was built from, or None if there is no readable database
+def read_signature(db_path):
+    if not os.path.exists(db_path):
+        return None
+    try:
+        connection = open_read_only(db_path)
+        try:
+            return json.loads(connection.execute('SELECT source FROM meta').fetchone()[0])
+        finally:
+            connection.close()
+    except (duckdb.Error, ValueError, TypeError):
+        return None
+
+#Returns the default database location for a CSV, e.g. combinedstats.csv -> combinedstats.duckdb
+def default_db_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.duckdb'
+
+#Read-only queries against the stats database
+class StatsDatabase:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.pid = None
+        self.connection = None
+        self.local = threading.local()
+
+    #DuckDB connections do not survive a fork and are not shared between threads. Each process opens the file
+    #read-only on first use, so gunicorn workers read it side by side, and each thread queries through its own cursor
+    def _cursor(self):
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.connection = open_read_only(self.db_path)
+                    self.local = threading.local()
+                    self.pid = os.getpid()
+        cursor = getattr(self.local, 'cursor', None)
+        if cursor is None:
+            cursor = self.local.cursor = self.connection.cursor()
+            cursor.execute('USE stats_file')
+        return cursor
+
+    def query(self, sql, params=()):
+        return self._cursor().execute(sql, params).df()
+
+    #Every column of the rows of one season with more than min_games games played, in file order
+    def season_rows(self, season, min_games):
+        return self.query('SELECT * EXCLUDE (row_id) FROM stats WHERE season = ? AND gamesPlayed > ? ORDER BY row_id',
+                          [season, min_games])
+
+    #The distinct values of a column in ascending order and how often each occurs
+    def value_counts(self, column):
+        counts = self.query('SELECT "' + column + '" AS value, count(*) AS count FROM stats GROUP BY 1 ORDER BY 1')
+        return counts['value'].to_numpy(), counts['count'].to_numpy()
+
+    def _graph_filter(self, season, min_games):
+        if season == 'All':
+            return 'gamesPlayed > ?', [min_games]
+        return 'gamesPlayed > ? AND season = ?', [min_games, season]
+
+    #Cap hit, goals, assists and points at a strength and position of the rows shown in the graph view, in file order
+    def graph_rows(self, season, strength, min_games):
+        where, params = self._graph_filter(season, min_games)
+        goals, assists, points = strength_expressions[strength]
+        return self.query('SELECT salary, ' + goals + ' AS goals, ' + assists + ' AS assists, ' + points +
+                          ' AS points, primaryPosition FROM stats WHERE ' + where + ' ORDER BY row_id', params)
+
+    #Mean cap hit for each value of goals, assists or points at a strength
+    def cap_hit_means(self, season, strength, stat, min_games):
+        where, params = self._graph_filter(season, min_games)
+        expression = strength_expressions[strength][['goals', 'assists', 'points'].index(stat)]
+        return self.query('SELECT ' + expression + ' AS ' + stat + ', avg(salary) AS salary FROM stats WHERE ' + where +
+                          ' GROUP BY 1 ORDER BY 1', params)
+
+#Opens the database for a CSV, rebuilding it first if it is missing or older than the CSV
+def connect(csv_path, db_path=None):
+    db_path = db_path or default_db_path(csv_path)
+    if read_signature(db_path) != nhl_store.source_signature(csv_path):
+        ingest(csv_path, db_path)
+    return StatsDatabase(db_path)
+
+if __name__ == '__main__':
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else 'combinedstats.csv'
+    db_path = sys.argv[2] if len(sys.argv) > 2 else default_db_path(csv_path)
+    ingest(csv_path, db_path)
+    rows = StatsDatabase(db_path).query('SELECT count(*) AS rows FROM stats')['rows'][0]
+    print('Wrote ' + str(rows) + ' rows to ' + db_path + ' (' + str(os.path.getsize(db_path)) + ' bytes)')
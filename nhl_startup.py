@@ -0,0 +1,119 @@
+# Startup time report for the dashboard
+#Imports NHLDashboard in fresh interpreters with python -X importtime and reports where the import time goes: per
+#top-level package, per module imported by the dashboard and the slowest single modules. Then times the startup
+#phases (import, first data access, building every tab and, with --warm, warming the caches) with and without
+#NHL_LAZY_START
+#Run: python nhl_startup.py [--modes eager,lazy] [--top 15] [--repeat 3] [--warm] [--output startup.json]
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+module = 'NHLDashboard'
+mode_env = {'eager': {'NHL_LAZY_START': '0'}, 'lazy': {'NHL_LAZY_START': '1'}}
+
+#Times each startup phase in a fresh interpreter and prints them as JSON
+phase_script = '''
+import json, sys, time
+start = time.perf_counter()
+times = {}
+import NHLDashboard as dashboard
+times['import'] = time.perf_counter() - start
+mark = time.perf_counter()
+dashboard.get_data()
+times['data'] = time.perf_counter() - mark
+mark = time.perf_counter()
+for label, tab_id, build in dashboard.tabs:
+    build()
+times['tabs'] = time.perf_counter() - mark
+if 'warm' in sys.argv:
+    mark = time.perf_counter()
+    dashboard.warm_caches()
+    times['warm'] = time.perf_counter() - mark
+times['total'] = time.perf_counter() - start
+print(json.dumps(times))
+'''
+
+def environment(mode):
+    env = dict(os.environ)
+    env.update(mode_env[mode])
+    return env
+
+#Parses the -X importtime log. Returns (module, self seconds, cumulative seconds, depth) in import order, where depth
+#is the nesting level of the import
+def parse_importtime(log):
+    rows = []
+    for line in log.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        rows.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6, depth))
+    return rows
+
+def import_times(mode):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], env=environment(mode),
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+    return parse_importtime(result.stderr)
+
+def phase_times(mode, warm):
+    result = subprocess.run([sys.executable, '-c', phase_script] + (['warm'] if warm else []), env=environment(mode), capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+    return json.loads(result.stdout.splitlines()[-1])
+
+#Summarizes one import log: the total, self time per top-level package, the cumulative time of each module the
+#dashboard imports directly and the slowest modules by self time
+def summarize(rows, top):
+    packages = defaultdict(float)
+    for name, self_seconds, _, _ in rows:
+        packages[name.split('.')[0]] += self_seconds
+    dashboard = [row for row in rows if row[0] == module][-1]
+    #The dashboard's own imports are logged before it, one level deeper, up to the previous top-level import
+    direct = []
+    for row in reversed(rows[:rows.index(dashboard)]):
+        if row[3] <= dashboard[3]:
+            break
+        if row[3] == dashboard[3] + 1:
+            direct.append(row)
+    return {'total': sum(row[1] for row in rows),
+            'packages': sorted(packages.items(), key=lambda item: -item[1])[:top],
+            'direct': sorted(((name, cumulative) for name, _, cumulative, _ in direct), key=lambda item: -item[1])[:top],
+            'modules': sorted(((name, self_seconds) for name, self_seconds, _, _ in rows), key=lambda item: -item[1])[:top]}
+
+def print_table(title, items):
+    print(title)
+    for name, seconds in items:
+        print('  %-50s %9.1f ms' % (name, seconds * 1000))
+
+def main():
+    parser = argparse.ArgumentParser(description='Report where the dashboard spends its startup time')
+    parser.add_argument('--modes', default='eager,lazy', help='comma separated startup modes: eager, lazy')
+    parser.add_argument('--top', type=int, default=15, help='rows per table')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per mode, the fastest is reported')
+    parser.add_argument('--warm', action='store_true', help='also time warming every cache, slow')
+    parser.add_argument('--output', help='also write the report as JSON to this file')
+    args = parser.parse_args()
+    report = {}
+    for mode in args.modes.split(','):
+        runs = [import_times(mode) for _ in range(args.repeat)]
+        summary = summarize(min(runs, key=lambda rows: sum(row[1] for row in rows)), args.top)
+        phase_runs = [phase_times(mode, args.warm) for _ in range(args.repeat)]
+        summary['phases'] = min(phase_runs, key=lambda phases: phases['total'])
+        report[mode] = summary
+        print('== %s (NHL_LAZY_START=%s), import %.1f ms' % (mode, mode_env[mode]['NHL_LAZY_START'], summary['total'] * 1000))
+        print_table('self time per package', summary['packages'])
+        print_table('imported by ' + module + ' (cumulative)', summary['direct'])
+        print_table('slowest modules (self)', summary['modules'])
+        print_table('startup phases', [(phase, seconds) for phase, seconds in summary['phases'].items()])
+        print()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+
+if __name__ == '__main__':
+    main()
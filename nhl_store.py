@@ -0,0 +1,202 @@
+# Columnar binary store for combinedstats.csv
+#Converts the CSV once into a directory of typed .npy columns plus a schema file. The dashboard memory-maps the
+#columns at startup instead of parsing the CSV, so every process shares the same pages through the OS page cache
+#Run directly to (re)build the store: python nhl_store.py [combinedstats.csv] [combinedstats.store]
+import io
+import json
+import os
+import shutil
+import sys
+import numpy as np
+import pandas as pd
+
+#Explicit schema for every column in the CSV
+#category: strings stored as integer codes plus a list of categories
+#integer: integer stats downcast to the smallest integer type that holds them
+#float: kept as float64 so percentages display exactly as in the CSV
+#seconds: 'mm:ss' time strings parsed to integer seconds
+schema = {'player_id': 'integer',
+          'firstName': 'category',
+          'lastName': 'category',
+          'birthDate': 'category',
+          'primaryPosition': 'category',
+          'shootsCatches': 'category',
+          'season': 'category',
+          'gamesPlayed': 'integer',
+          'goals': 'integer',
+          'assists': 'integer',
+          'points': 'integer',
+          'pointsPerGame': 'float',
+          'plusMinus': 'integer',
+          'shots': 'integer',
+          'shootingPercentage': 'float',
+          'penaltyMinutes': 'integer',
+          'timeOnIce': 'integer',
+          'avgTimeOnIce': 'seconds',
+          'faceOffWins': 'integer',
+          'faceOffLosses': 'integer',
+          'faceOffTaken': 'integer',
+          'faceOffPercentage': 'float',
+          'hits': 'integer',
+          'blocks': 'integer',
+          'takeaways': 'integer',
+          'giveaways': 'integer',
+          'turnoverDifferential': 'integer',
+          'powerPlayGoals': 'integer',
+          'powerPlayAssists': 'integer',
+          'powerPlayPoints': 'integer',
+          'powerPlayTimeOnIce': 'integer',
+          'avgPowerPlayTimeOnIce': 'seconds',
+          'shortHandedGoals': 'integer',
+          'shortHandedAssists': 'integer',
+          'shortHandedPoints': 'integer',
+          'shortHandedTimeOnIce': 'integer',
+          'avgShortHandedTimeOnIce': 'seconds',
+          'salary': 'integer'}
+
+#Bumped whenever the schema or the file layout changes so stale stores are rebuilt
+store_version = 2
+
+#Parses 'mm:ss' time strings, e.g. '16:6', to integer seconds
+def parse_seconds(col):
+    parts = col.astype(str).str.split(':', expand=True).astype('int64')
+    return parts[0] * 60 + parts[1]
+
+#Converts a raw CSV frame to the typed columns described by the schema
+def apply_schema(frame):
+    typed = {}
+    for column, kind in schema.items():
+        values = frame[column]
+        if kind == 'category':
+            values = values.astype(str).astype('category')
+        elif kind == 'seconds':
+            values = pd.to_numeric(parse_seconds(values), downcast='integer')
+        elif kind == 'integer':
+            values = pd.to_numeric(values.astype('int64'), downcast='integer')
+        else:
+            values = values.astype('float64')
+        typed[column] = values
+    return pd.DataFrame(typed)
+
+#Identifies the CSV a store was built from so a changed file triggers a rebuild
+def source_signature(csv_path):
+    return _signature(os.stat(csv_path))
+
+def _signature(stat):
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'version': store_version}
+
+#Hashes each line, so rows can be matched to the lines they were parsed from
+def hash_lines(lines):
+    return pd.util.hash_array(np.asarray(lines, dtype=object))
+
+#Reads the CSV as lines without parsing it. Returns its signature, the header and the non-empty data lines
+def read_lines(csv_path):
+    with open(csv_path) as f:
+        signature = _signature(os.fstat(f.fileno()))
+        lines = f.read().splitlines()
+    return signature, lines[0], [line for line in lines[1:] if line]
+
+#Parses data lines of the CSV to typed columns
+def parse_lines(header, lines):
+    return apply_schema(pd.read_csv(io.StringIO(header + '\n' + '\n'.join(lines))))
+
+#Concatenates typed frames, merging the categories of category columns so they stay categorical
+def concat(frames):
+    columns = {}
+    for column in frames[0].columns:
+        parts = [frame[column] for frame in frames]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            columns[column] = pd.api.types.union_categoricals([part.array for part in parts])
+        else:
+            columns[column] = np.concatenate([part.to_numpy() for part in parts])
+    return pd.DataFrame(columns)
+
+#Writes a typed frame as one .npy file per column plus schema.json, and the hashes of the CSV lines behind its rows
+#if given. The directory is written next to the target and renamed into place, so readers never see a partially
+#written store
+def write_store(frame, store_path, signature=None, line_hashes=None):
+    tmp_path = store_path + '.tmp' + str(os.getpid())
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    columns = {}
+    for column in frame.columns:
+        values = frame[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(tmp_path, column + '.npy'), values.cat.codes.to_numpy())
+            columns[column] = {'kind': 'category', 'categories': [str(c) for c in values.cat.categories]}
+        else:
+            np.save(os.path.join(tmp_path, column + '.npy'), values.to_numpy())
+            columns[column] = {'kind': schema.get(column, 'float'), 'dtype': str(values.dtype)}
+    if line_hashes is not None:
+        np.save(os.path.join(tmp_path, 'lines.npy'), line_hashes)
+    meta = {'rows': len(frame), 'columns': columns, 'source': signature}
+    with open(os.path.join(tmp_path, 'schema.json'), 'w') as f:
+        json.dump(meta, f)
+    #Swap the new store in, moving any previous store aside first since directories cannot be replaced directly
+    old_path = store_path + '.old' + str(os.getpid())
+    try:
+        os.rename(store_path, old_path)
+    except FileNotFoundError:
+        pass
+    try:
+        os.rename(tmp_path, store_path)
+    except OSError:
+        #Another process swapped in its store first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+#Memory-maps a store. Numeric columns and category codes are read-only views of the files, nothing is copied
+def read_store(store_path):
+    with open(os.path.join(store_path, 'schema.json')) as f:
+        meta = json.load(f)
+    columns = {}
+    for column, info in meta['columns'].items():
+        values = np.load(os.path.join(store_path, column + '.npy'), mmap_mode='r')
+        if info['kind'] == 'category':
+            dtype = pd.CategoricalDtype(info['categories'])
+            values = pd.Series(pd.Categorical.from_codes(values, dtype=dtype, validate=False), copy=False)
+        columns[column] = values
+    return pd.DataFrame(columns, copy=False)
+
+#Returns the schema.json metadata of a store, or None if there is no readable store
+def read_meta(store_path):
+    try:
+        with open(os.path.join(store_path, 'schema.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+#Returns the hashes of the CSV lines behind each row of a store, or None if the store has none
+def read_line_hashes(store_path):
+    try:
+        return np.load(os.path.join(store_path, 'lines.npy'), mmap_mode='r')
+    except OSError:
+        return None
+
+#Parses the CSV and writes it to the store
+def ingest(csv_path, store_path):
+    signature, header, lines = read_lines(csv_path)
+    frame = parse_lines(header, lines)
+    #Line hashes are only kept when every line is one row, quoted fields spanning lines would misalign them
+    write_store(frame, store_path, signature, hash_lines(lines) if len(lines) == len(frame) else None)
+
+#Returns the default store location for a CSV, e.g. combinedstats.csv -> combinedstats.store
+def default_store_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.store'
+
+#Loads the dataset, rebuilding the store first if it is missing or older than the CSV
+def load(csv_path, store_path=None):
+    store_path = store_path or default_store_path(csv_path)
+    meta = read_meta(store_path)
+    if meta is None or meta['source'] != source_signature(csv_path):
+        ingest(csv_path, store_path)
+    return read_store(store_path)
+
+if __name__ == '__main__':
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else 'combinedstats.csv'
+    store_path = sys.argv[2] if len(sys.argv) > 2 else default_store_path(csv_path)
+    ingest(csv_path, store_path)
+    frame = read_store(store_path)
+    size = sum(os.path.getsize(os.path.join(store_path, f)) for f in os.listdir(store_path))
+    print('Wrote ' + str(len(frame)) + ' rows to ' + store_path + ' (' + str(size) + ' bytes)')
+    print(frame.dtypes.to_string())
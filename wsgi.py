@@ -0,0 +1,17 @@
+# WSGI entry point for serving the dashboard under a multi-process server
+#   gunicorn -c gunicorn.conf.py wsgi:server
+#gunicorn.conf.py sets preload_app, so this module is imported once in the master process. The dataset is memory-mapped
+#from the columnar store and every cache is warmed here, then the workers are forked and share those pages with the
+#master instead of each loading and indexing its own copy
+import gc
+import NHLDashboard
+
+#With NHL_LAZY_START=1 nothing is loaded here, each worker loads the dataset on its first request instead
+if not NHLDashboard.lazy_start:
+    NHLDashboard.warm_caches()
+#Move everything built so far out of the garbage collector's reach. Collections in the workers would otherwise write
+#to the header of every shared object and copy the pages holding them into each worker
+gc.freeze()
+
+app = NHLDashboard.app
+server = app.server